@@ -0,0 +1,3 @@
+"""
+Benchmarks for Habitica Manager, run against a local stand-in Habitica server.
+"""
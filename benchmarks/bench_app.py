@@ -0,0 +1,261 @@
+"""
+Benchmark the Flask app end to end against a local mock Habitica server.
+
+Each task count runs in a fresh process with its own temporary database, so
+results don't depend on earlier runs. The app is built with create_app() and
+driven through Flask's test client, which leaves out HTTP parsing but covers
+everything the app does: routing, the task store, upstream calls, JSON
+encoding and template rendering.
+
+Scenarios:
+- tasks: GET /api/tasks (all tasks grouped by type)
+- tasks_ndjson: GET /api/tasks?format=ndjson (all tasks, one per line)
+- todos: GET /api/todos
+- todos_page: GET /api/todos?limit=50
+- search: GET /api/search?q=number+12 (full-text search)
+- clone_todo: POST /api/clone_todo (one upstream read and one create)
+- page_home: GET / (template render)
+- page_scheduled: GET /scheduled
+
+Each scenario also reports the peak memory Python allocated while serving one
+request (peak_kb, measured with tracemalloc and the body discarded as it is
+streamed). Results are printed and written as JSON. Pass --baseline with an earlier
+results file to fail (exit status 1) when a scenario's p95 got slower by more
+than --tolerance.
+
+Usage:
+    python -m benchmarks.bench_app [--tasks 10,1000,50000] [--requests 200] [--concurrency 1]
+                                   [--latency 0.0] [--rate-limit 0] [--scenarios tasks,todos]
+                                   [--output results.json] [--baseline old.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+# Scenario name -> (method, path); clone_todo's body is filled in with a real todo ID
+SCENARIOS = {
+    'tasks': ('GET', '/api/tasks'),
+    'tasks_ndjson': ('GET', '/api/tasks?format=ndjson'),
+    'todos': ('GET', '/api/todos'),
+    'todos_page': ('GET', '/api/todos?limit=50'),
+    'search': ('GET', '/api/search?q=number+12'),
+    'clone_todo': ('POST', '/api/clone_todo'),
+    'page_home': ('GET', '/'),
+    'page_scheduled': ('GET', '/scheduled'),
+}
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles (ms) and throughput for one scenario"""
+    ordered = sorted(latencies)
+    if len(ordered) > 1:
+        cuts = statistics.quantiles(ordered, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput': round(len(ordered) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(p50 * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def peak_memory(app, method, path, body):
+    """Peak memory (KiB) allocated while serving one request, not counting the response body"""
+    client = app.test_client()
+    tracemalloc.start()
+    try:
+        response = client.open(path, method=method, json=body, buffered=False)
+        for _ in response.response:
+            pass
+        response.close()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(app, method, path, body, requests, concurrency, warmup):
+    """Send requests from concurrency threads and collect per-request latencies"""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def worker(count):
+        nonlocal errors
+        client = app.test_client()
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()  # Drain streamed bodies
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors += 1
+
+    client = app.test_client()
+    for _ in range(warmup):
+        client.open(path, method=method, json=body).get_data()
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(share,)) for share in shares if share]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def bench_task_count(task_count, args):
+    """Run every scenario against a fresh app and mock server (in a child process)"""
+    # Keep the app's logging out of the results table; failed requests are counted as errors
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    from benchmarks.mock_habitica import MockHabiticaServer
+
+    server = MockHabiticaServer(task_count=task_count, latency=args.latency,
+                                rate_limit=args.rate_limit, window=args.window).start()
+    data_dir = tempfile.mkdtemp(prefix='hbm-bench-')
+    os.environ.update({
+        'HABITICA_USER_ID': '00000000-0000-0000-0000-000000000000',
+        'HABITICA_API_TOKEN': '00000000-0000-0000-0000-000000000000',
+        'HABITICA_API_URL': server.api_url,
+        'DATABASE_PATH': os.path.join(data_dir, 'hbm.db'),
+        # The mock's own rate limit (if any) is the one being tested, via its headers
+        'HABITICA_RATE_LIMIT': '1000000',
+        # Scheduled syncs would add noise; reads still refresh a stale snapshot
+        'SYNC_SCHEDULER': 'False',
+        'FLASK_DEBUG': 'False',
+    })
+
+    from habitica_manager.app import create_app
+    app = create_app()
+    logging.disable(logging.CRITICAL)
+
+    todo_id = next(task['id'] for task in server.tasks if task['type'] == 'todo')
+    results = []
+    try:
+        for name in args.scenarios:
+            method, path = SCENARIOS[name]
+            body = {'todo_id': todo_id} if name == 'clone_todo' else None
+            result = run_scenario(app, method, path, body, args.requests, args.concurrency, args.warmup)
+            result['peak_kb'] = peak_memory(app, method, path, body)
+            result.update({'tasks': task_count, 'scenario': name,
+                           'upstream_requests': server.request_count, 'upstream_429s': server.rejected_count})
+            results.append(result)
+    finally:
+        server.stop()
+    return results
+
+
+# Settings that change what a result means; comparing runs that differ in these is misleading
+COMPARABLE_SETTINGS = ('requests', 'warmup', 'concurrency', 'latency', 'rate_limit', 'window')
+
+
+def compare(results, config, baseline_path, tolerance):
+    """Print p95 changes against a baseline; returns the regressed scenarios"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    previous = {(row['tasks'], row['scenario']): row for row in baseline['results']}
+    regressions = []
+
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%}):")
+    differing = [key for key in COMPARABLE_SETTINGS if baseline['config'].get(key) != config.get(key)]
+    if differing:
+        print(f"  Note: the baseline was run with different settings ({', '.join(differing)})")
+    for row in results:
+        old = previous.get((row['tasks'], row['scenario']))
+        if old is None or not old['p95_ms']:
+            continue
+        change = row['p95_ms'] / old['p95_ms'] - 1
+        flag = 'REGRESSION' if change > tolerance else ''
+        print(f"  {row['scenario']:<15} {row['tasks']:>6} tasks  p95 {old['p95_ms']:9.2f} -> "
+              f"{row['p95_ms']:9.2f} ms  ({change:+.0%}) {flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+
+def git_commit():
+    """Current commit, to tie results to the code they measured"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', default='100,5000', help='comma-separated task counts (10 to 50000)')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests before each scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads')
+    parser.add_argument('--latency', type=float, default=0.0, help='mock server latency in seconds')
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help='mock server requests per window before it answers 429 (0: unlimited)')
+    parser.add_argument('--window', type=float, default=60.0, help='mock server rate limit window in seconds')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/bench_app-<time>.json)')
+    parser.add_argument('--baseline', help='earlier results file to compare p95 latencies with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown vs the baseline')
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    task_counts = [int(count) for count in args.tasks.split(',')]
+
+    print(f"{'scenario':<15} {'tasks':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>9} "
+          f"{'errors':>6}")
+    results = []
+    for task_count in task_counts:
+        # A fresh interpreter per task count, so module-level app state starts clean
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            rows = pool.submit(bench_task_count, task_count, args).result()
+        for row in rows:
+            print(f"{row['scenario']:<15} {row['tasks']:>6} {row['throughput']:>8.1f} {row['p50_ms']:>9.2f} "
+                  f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['peak_kb']:>9.0f} {row['errors']:>6}")
+        results.extend(rows)
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"bench_app-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    output.write_text(json.dumps({
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'results': results,
+    }, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.baseline and compare(results, config, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark concurrent upstream throughput of one worker.
+
+Runs the same number of uncached GET user calls against a local mock Habitica
+server with injected latency, two ways:
+
+- sync: HabiticaService, one call at a time (a gunicorn 'sync' worker)
+- threads: HabiticaService shared by a thread pool (a 'gthread' worker, the default)
+
+Usage:
+    python -m benchmarks.bench_concurrency [--requests 100] [--concurrency 20] [--latency 0.1]
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_habitica import MockHabiticaServer
+
+# Dummy credentials so the services can be constructed
+os.environ.setdefault('HABITICA_USER_ID', '00000000-0000-0000-0000-000000000000')
+os.environ.setdefault('HABITICA_API_TOKEN', '00000000-0000-0000-0000-000000000000')
+# The mock server has no rate limit, so don't pace requests to Habitica's
+os.environ.setdefault('HABITICA_RATE_LIMIT', '1000000')
+
+
+def report(name, count, elapsed):
+    """Print throughput for a scenario"""
+    print(f"{name:<10} {count} requests in {elapsed:6.2f}s   {count / elapsed:8.1f} req/s")
+
+
+def bench_sync(service, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        service._make_request('user')
+    return time.perf_counter() - start
+
+
+def bench_threads(service, count, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: service._make_request('user'), range(count)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=20, help='requests in flight at once')
+    parser.add_argument('--latency', type=float, default=0.1, help='mock server latency in seconds')
+    args = parser.parse_args()
+
+    server = MockHabiticaServer(task_count=10, latency=args.latency).start()
+    os.environ['HABITICA_API_URL'] = server.api_url
+    os.environ['HABITICA_POOL_SIZE'] = str(args.concurrency)
+
+    from habitica_manager.database import init_database
+    from habitica_manager.habitica_service import HabiticaService
+    init_database()
+
+    try:
+        print(f"{args.requests} GET user calls, {args.latency * 1000:.0f}ms upstream latency, "
+              f"concurrency {args.concurrency}")
+        service = HabiticaService()
+        report('sync', args.requests, bench_sync(service, args.requests))
+        report('threads', args.requests, bench_threads(service, args.requests, args.concurrency))
+        service.close()
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark per-request latency of HabiticaService against a local mock server.
+
+Compares one-off connections (module-level requests.get, as the service used
+to do) with the pooled keep-alive session owned by HabiticaService, and shows
+the full service request path on top of the session.
+
+Usage:
+    python -m benchmarks.bench_session [--requests 200] [--tasks 100]
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import requests
+
+from benchmarks.mock_habitica import MockHabiticaServer
+
+# Dummy credentials so the service can be constructed
+os.environ.setdefault('HABITICA_USER_ID', '00000000-0000-0000-0000-000000000000')
+os.environ.setdefault('HABITICA_API_TOKEN', '00000000-0000-0000-0000-000000000000')
+# The mock server has no rate limit, so don't pace requests to Habitica's
+os.environ.setdefault('HABITICA_RATE_LIMIT', '1000000')
+
+
+def summarize(name, samples):
+    """Print latency statistics in milliseconds"""
+    samples = sorted(s * 1000 for s in samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(samples):7.3f} ms   "
+          f"p50 {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+def bench_unpooled(service, count):
+    """A new connection and header dict for every request"""
+    url = f"{service.api_url}/tasks/user"
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = requests.get(url, headers=service._get_headers(), timeout=10)
+        response.json()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_pooled(service, count):
+    """Requests through the service's keep-alive session"""
+    url = f"{service.api_url}/tasks/user"
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = service.session.get(url, timeout=service.timeout)
+        response.json()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_service(service, count):
+    """The full HabiticaService request path, including rate limiting"""
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        service._make_request('tasks/user')
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--tasks', type=int, default=100, help='tasks returned by tasks/user')
+    args = parser.parse_args()
+
+    server = MockHabiticaServer(task_count=args.tasks).start()
+    os.environ['HABITICA_API_URL'] = server.api_url
+
+    from habitica_manager.database import init_database
+    from habitica_manager.habitica_service import HabiticaService
+    init_database()
+    service = HabiticaService()
+
+    try:
+        # Warm up both paths once
+        bench_unpooled(service, 5)
+        bench_pooled(service, 5)
+
+        print(f"{args.requests} sequential GET tasks/user ({args.tasks} tasks) against {server.api_url}")
+        summarize('unpooled (requests.get)', bench_unpooled(service, args.requests))
+        summarize('pooled session', bench_pooled(service, args.requests))
+        summarize('HabiticaService request', bench_service(service, args.requests))
+    finally:
+        service.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark cold start: importing the app module, create_app() and the first request.
+
+Each run is a fresh interpreter with its own temporary database, like a newly
+started or recycled worker that does not share a preloaded app.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Runs inside the child interpreter and prints its timings as JSON
+CHILD = '''
+import json, logging, time
+start = time.perf_counter()
+from habitica_manager.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+logging.disable(logging.CRITICAL)
+app.test_client().get('/health')
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - created) * 1000, 'total_ms': (served - start) * 1000}))
+'''
+
+
+def run_once(env):
+    """Time one cold start in a fresh interpreter"""
+    result = subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, text=True,
+                            cwd=Path(__file__).parent.parent, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='cold starts to time')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='hbm-startup-')
+    env = dict(os.environ,
+               HABITICA_USER_ID='00000000-0000-0000-0000-000000000000',
+               HABITICA_API_TOKEN='00000000-0000-0000-0000-000000000000',
+               # Unreachable, so nothing is fetched from the real Habitica
+               HABITICA_API_URL='http://127.0.0.1:9/api/v3',
+               DATABASE_PATH=os.path.join(data_dir, 'hbm.db'),
+               SYNC_SCHEDULER='False')
+
+    # The first start creates the database; later ones find it already set up
+    first = run_once(env)
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    print(f"First start (new database): {first['total_ms']:.0f}ms")
+    print(f"Median of {args.runs} starts with an existing database:")
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms'):
+        print(f"  {key[:-3]:<15} {statistics.median(run[key] for run in runs):8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+A local stand-in for the Habitica v3 API, used by the benchmarks.
+
+Only the endpoints used by HabiticaService are implemented. Responses follow
+Habitica's envelope format ({"success": true, "data": ...}).
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+# Tags assigned round-robin to generated tasks
+TAGS = [
+    {'id': str(uuid.UUID(int=10 ** 9 + i)), 'name': name}
+    for i, name in enumerate(['work', 'home', 'health', 'errands'])
+]
+
+
+def make_tasks(count: int) -> List[Dict]:
+    """Generate a realistic mix of todos, habits and dailies"""
+    tasks = []
+    for i in range(count):
+        task_type = ('todo', 'habit', 'daily')[i % 3]
+        task = {
+            'id': str(uuid.UUID(int=i + 1)),
+            '_id': str(uuid.UUID(int=i + 1)),
+            'type': task_type,
+            'text': f"{task_type.title()} number {i}",
+            'notes': f"Notes for task {i}" if i % 2 else '',
+            'priority': (0.1, 1, 1.5, 2)[i % 4],
+            'value': 0,
+            'tags': [TAGS[i % len(TAGS)]['id']] if i % 5 else [],
+            'checklist': [],
+            'reminders': [],
+            'createdAt': '2025-01-01T00:00:00.000Z',
+            'updatedAt': '2025-01-01T00:00:00.000Z',
+            'userId': '00000000-0000-0000-0000-000000000000'
+        }
+        if task_type == 'todo':
+            task['completed'] = False
+            task['date'] = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00.000Z" if i % 2 else None
+            task['checklist'] = [
+                {'id': str(uuid.uuid4()), 'text': f"Subtask {j}", 'completed': False}
+                for j in range(i % 4)
+            ]
+        elif task_type == 'habit':
+            task.update({'up': True, 'down': False, 'counterUp': i, 'counterDown': 0,
+                         'history': [{'date': 1735689600000 + d, 'value': 1} for d in range(20)]})
+        else:
+            task.update({'completed': False, 'streak': i % 10, 'frequency': 'weekly',
+                         'history': [{'date': 1735689600000 + d, 'value': 1} for d in range(20)]})
+        tasks.append(task)
+    return tasks
+
+
+class MockHabiticaHandler(BaseHTTPRequestHandler):
+    """Request handler serving the mock API"""
+
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, delayed ACKs add ~40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode('utf-8')
+        headers = dict(self._rate_limit_headers(), **(headers or {}))
+
+        # Weak ETags and conditional GETs, like Habitica's Express server
+        etag = None
+        if self.command == 'GET' and status == 200:
+            etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _rate_limit_headers(self) -> Dict[str, str]:
+        server = self.server
+        if not server.rate_limit:
+            return {}
+        remaining = max(0, server.rate_limit - server.window_count)
+        reset = time.strftime('%a %b %d %Y %H:%M:%S GMT+0000 (Coordinated Universal Time)',
+                              time.gmtime(server.window_start + server.window))
+        return {'X-RateLimit-Limit': str(server.rate_limit),
+                'X-RateLimit-Remaining': str(remaining),
+                'X-RateLimit-Reset': reset}
+
+    def _check_rate_limit(self) -> bool:
+        """Count the request against the window; returns False if it must be rejected"""
+        server = self.server
+        if not server.rate_limit:
+            return True
+        with server.lock:
+            now = time.time()
+            if now >= server.window_start + server.window:
+                server.window_start = now
+                server.window_count = 0
+            server.window_count += 1
+            return server.window_count <= server.rate_limit
+
+    def _route(self, method: str):
+        server = self.server
+        server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        # Read the body even when rejecting, or it would be parsed as the next request on the connection
+        body = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = json.loads(self.rfile.read(length))
+
+        if not self._check_rate_limit():
+            server.rejected_count += 1
+            retry_after = max(1, int(server.window_start + server.window - time.time()) + 1)
+            return self._send(429, {'success': False, 'error': 'TooManyRequests',
+                                    'message': 'Rate limit exceeded'},
+                              {'Retry-After': str(retry_after)})
+
+        path = self.path.split('?', 1)[0]
+        prefix = '/api/v3/'
+        if not path.startswith(prefix):
+            return self._send(404, {'success': False, 'message': 'Not found'})
+        endpoint = path[len(prefix):]
+
+        if method == 'GET' and endpoint == 'tasks/user':
+            return self._send(200, {'success': True, 'data': server.tasks})
+        if method == 'GET' and endpoint == 'tags':
+            return self._send(200, {'success': True, 'data': TAGS})
+        if method == 'GET' and endpoint == 'user':
+            return self._send(200, {'success': True, 'data': {
+                'auth': {'local': {'username': 'benchmark'}},
+                'stats': {'lvl': 10, 'class': 'warrior', 'exp': 42}
+            }})
+        if method == 'GET' and endpoint.startswith('tasks/'):
+            task_id = endpoint.split('/', 1)[1]
+            for task in server.tasks:
+                if task['id'] == task_id:
+                    return self._send(200, {'success': True, 'data': task})
+            return self._send(404, {'success': False, 'message': 'Task not found'})
+        if method == 'POST' and endpoint == 'tasks/user':
+            items = body if isinstance(body, list) else [body]
+            created = []
+            for item in items:
+                task = dict(item, id=str(uuid.uuid4()))
+                task['_id'] = task['id']
+                server.tasks.append(task)
+                created.append(task)
+            return self._send(201, {'success': True, 'data': created if isinstance(body, list) else created[0]})
+        if endpoint == 'user/webhook':
+            if method == 'GET':
+                return self._send(200, {'success': True, 'data': server.webhooks})
+            if method == 'POST':
+                webhook = dict(body, id=str(uuid.uuid4()))
+                server.webhooks.append(webhook)
+                return self._send(201, {'success': True, 'data': webhook})
+        if endpoint.startswith('user/webhook/') and method in ('PUT', 'DELETE'):
+            webhook_id = endpoint.rsplit('/', 1)[1]
+            for webhook in server.webhooks:
+                if webhook['id'] == webhook_id:
+                    if method == 'DELETE':
+                        server.webhooks.remove(webhook)
+                        return self._send(200, {'success': True, 'data': server.webhooks})
+                    webhook.update(body, id=webhook_id)
+                    return self._send(200, {'success': True, 'data': webhook})
+            return self._send(404, {'success': False, 'message': 'Webhook not found'})
+        return self._send(404, {'success': False, 'message': 'Not found'})
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+
+class MockHabiticaServer(ThreadingHTTPServer):
+    """Threaded mock server with configurable task count, latency and rate limit.
+
+    With rate_limit set, at most that many requests are accepted per window
+    (seconds); further requests get a 429 with Retry-After, like Habitica.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, task_count: int = 100, latency: float = 0.0,
+                 rate_limit: int = 0, window: float = 60.0):
+        super().__init__((host, port), MockHabiticaHandler)
+        self.tasks = make_tasks(task_count)
+        self.webhooks = []
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = window
+        self.window_start = time.time()
+        self.window_count = 0
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.rejected_count = 0
+        self._thread = None
+
+    @property
+    def api_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v3"
+
+    def start(self) -> 'MockHabiticaServer':
+        """Serve requests from a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the socket"""
+        self.shutdown()
+        self.server_close()
@@ -1,16 +1,29 @@
 # Gunicorn configuration file
 import os
+import shutil
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Workers write their metrics to files here so /metrics can sum them. This must
+# be set before the app (and prometheus_client) is loaded, and start out empty.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    str(Path(__file__).parent / 'data' / 'metrics'))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
 # Server socket
 bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
 backlog = 2048
 
 # Worker processes
 workers = int(os.getenv('WORKERS', '4'))
-worker_class = 'sync'
+# Threaded workers, so that a worker can wait on several Habitica calls at once
+# and hold dashboards' live update streams (up to SSE_MAX_STREAMS each) while
+# still serving other requests. Sync workers serve no streams.
+worker_class = os.getenv('WORKER_CLASS', 'gthread')
+threads = int(os.getenv('THREADS', '8'))
 worker_connections = 1000
 timeout = int(os.getenv('TIMEOUT', '120'))
 keepalive = 2
@@ -36,6 +49,21 @@ user = None
 group = None
 tmp_upload_dir = None
 
+# Server hooks
+def pre_fork(server, worker):
+    """Import the Habitica client in the master, so forked workers share it instead of each importing it"""
+    import habitica_manager.habitica_service  # noqa: F401
+
+def post_fork(server, worker):
+    """Start the background task sync and health checks in each worker (threads don't survive fork)"""
+    from habitica_manager.services import get_services
+    get_services(worker.app.wsgi()).start_background()
+
+def child_exit(server, worker):
+    """Drop the live-gauge files of a worker that exited; its counters are kept"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
 # SSL (uncomment if using HTTPS)
 # keyfile = None
 # certfile = None
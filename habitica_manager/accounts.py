@@ -0,0 +1,157 @@
+"""
+Habitica accounts served by this deployment.
+
+The account configured with HABITICA_USER_ID and HABITICA_API_TOKEN in the
+environment is always available as 'default'. Further accounts are stored in
+the accounts table and managed with the `flask accounts` commands (see cli.py).
+
+Acting for an account takes its access key: `flask accounts add` issues one for
+each stored account, and HABITICA_ACCESS_KEY sets the default account's. Only a
+hash of stored accounts' keys is kept. The default account stays open to anyone
+who can reach the app while HABITICA_ACCESS_KEY is unset.
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+import sqlite3
+from typing import Dict, List, Optional
+
+from . import task_store
+from .database import DEFAULT_ACCOUNT, get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Account IDs appear in headers, query strings, cache keys and lease names
+ACCOUNT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+class AccountNotFound(Exception):
+    """Raised when an account ID is not configured"""
+
+    def __init__(self, account_id: str):
+        super().__init__(f"Unknown account '{account_id}'")
+        self.account_id = account_id
+
+class AccessDenied(Exception):
+    """Raised when a request hasn't shown the access key of the account it is for"""
+
+    def __init__(self, account_id: str):
+        super().__init__(f"Sign in with the access key of account '{account_id}'")
+        self.account_id = account_id
+
+class Account:
+    """Credentials of one Habitica user"""
+
+    __slots__ = ('id', 'user_id', 'api_token', 'name', 'api_url')
+
+    def __init__(self, id: str, user_id: Optional[str], api_token: Optional[str], name: Optional[str] = None,
+                 api_url: Optional[str] = None):
+        self.id = id
+        self.user_id = user_id
+        self.api_token = api_token
+        self.name = name
+        self.api_url = api_url
+
+def get_account(account_id: str) -> Account:
+    """Get the credentials of an account; raises AccountNotFound"""
+    if account_id == DEFAULT_ACCOUNT:
+        return Account(DEFAULT_ACCOUNT, os.getenv('HABITICA_USER_ID'), os.getenv('HABITICA_API_TOKEN'))
+
+    row = get_connection().execute(
+        'SELECT id, user_id, api_token, name, api_url FROM accounts WHERE id = ?', (account_id,)
+    ).fetchone()
+    if row is None:
+        raise AccountNotFound(account_id)
+    return Account(*row)
+
+def list_accounts() -> List[Dict]:
+    """List the configured accounts, without their API tokens"""
+    user_id = os.getenv('HABITICA_USER_ID')
+    accounts = [{
+        'id': DEFAULT_ACCOUNT,
+        'name': None,
+        'user_id_preview': f"{user_id[:8]}..." if user_id else None
+    }]
+    rows = get_connection().execute('SELECT id, name, user_id FROM accounts ORDER BY id').fetchall()
+    accounts.extend({'id': row[0], 'name': row[1], 'user_id_preview': f"{row[2][:8]}..."} for row in rows)
+    return accounts
+
+def _hash_key(access_key: str) -> str:
+    # Keys are long and random, so a fast unsalted hash is enough
+    return hashlib.sha256(access_key.encode('utf-8')).hexdigest()
+
+def access_key_hash(account_id: str) -> Optional[str]:
+    """Hash of the key that currently opens an account; None if it has none or doesn't exist"""
+    if account_id == DEFAULT_ACCOUNT:
+        access_key = os.getenv('HABITICA_ACCESS_KEY')
+        return _hash_key(access_key) if access_key else None
+
+    row = get_connection().execute('SELECT access_key_hash FROM accounts WHERE id = ?', (account_id,)).fetchone()
+    return row[0] if row else None
+
+def default_account_open() -> bool:
+    """Whether the default account is usable without an access key"""
+    return not os.getenv('HABITICA_ACCESS_KEY')
+
+def check_access_key(account_id: str, access_key: Optional[str]) -> bool:
+    """Whether access_key opens an account; False for unknown accounts"""
+    if not access_key:
+        return False
+    expected = access_key_hash(account_id)
+    return expected is not None and hmac.compare_digest(expected, _hash_key(access_key))
+
+def issue_access_key(account_id: str) -> str:
+    """Give a stored account a new access key, revoking the old one; raises AccountNotFound"""
+    if account_id == DEFAULT_ACCOUNT:
+        raise ValueError(f"The '{DEFAULT_ACCOUNT}' account's access key is HABITICA_ACCESS_KEY in the .env file")
+
+    access_key = secrets.token_urlsafe(32)
+    with transaction() as conn:
+        updated = conn.execute(
+            'UPDATE accounts SET access_key_hash = ? WHERE id = ?', (_hash_key(access_key), account_id)
+        ).rowcount
+    if not updated:
+        raise AccountNotFound(account_id)
+    logger.info(f"Issued a new access key for account '{account_id}'")
+    return access_key
+
+def save_account(account_id: str, user_id: str, api_token: str, name: Optional[str] = None,
+                 api_url: Optional[str] = None):
+    """Add an account or replace its credentials; raises ValueError"""
+    if account_id == DEFAULT_ACCOUNT:
+        raise ValueError(f"The '{DEFAULT_ACCOUNT}' account is configured in the .env file")
+    if not ACCOUNT_ID_PATTERN.match(account_id):
+        raise ValueError("Account IDs may only contain letters, digits, '-' and '_' (at most 64 characters)")
+    if user_id == os.getenv('HABITICA_USER_ID'):
+        raise ValueError(f"User {user_id[:8]}... is already served as the '{DEFAULT_ACCOUNT}' account")
+
+    try:
+        with transaction() as conn:
+            conn.execute(
+                '''INSERT INTO accounts (id, user_id, api_token, name, api_url) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET user_id = excluded.user_id, api_token = excluded.api_token,
+                   name = excluded.name, api_url = excluded.api_url''',
+                (account_id, user_id, api_token, name, api_url)
+            )
+    except sqlite3.IntegrityError:
+        raise ValueError(f"User {user_id[:8]}... is already served by another account")
+    logger.info(f"Saved account '{account_id}'")
+
+def delete_account(account_id: str) -> bool:
+    """Remove an account with its stored tasks and cached responses; returns False if it didn't exist"""
+    if account_id == DEFAULT_ACCOUNT:
+        raise ValueError(f"The '{DEFAULT_ACCOUNT}' account is configured in the .env file")
+
+    with transaction() as conn:
+        deleted = conn.execute('DELETE FROM accounts WHERE id = ?', (account_id,)).rowcount == 1
+        if deleted:
+            task_store.delete_account_data(account_id)
+            # Keys of the SQLite response cache are prefixed with the account ID
+            prefix = f'{account_id}:'
+            conn.execute('DELETE FROM response_cache WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+    if deleted:
+        logger.info(f"Deleted account '{account_id}'")
+    return deleted
@@ -4,7 +4,8 @@ import os
 import sys
 import logging
 from dotenv import load_dotenv
-from .database import init_database, test_connection
+from .database import init_database
+from . import services
 
 # Load environment variables
 load_dotenv()
@@ -80,11 +81,6 @@ def create_app(config_name=None):
     logger = logging.getLogger(__name__)
     try:
         init_database()
-        db_info = test_connection()
-        if db_info['success']:
-            logger.info(f"Database ready at {db_info['db_path']} with {db_info['table_count']} tables")
-        else:
-            logger.error(f"Database test failed: {db_info['error']}")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         sys.exit(1)
@@ -102,16 +98,55 @@ def create_app(config_name=None):
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     app.config['DEBUG'] = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    # The session remembers which accounts the browser signed in to (see routes.login)
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    # Signs the tokens in Habitica webhook URLs; changing it requires registering the webhooks again
+    app.config['WEBHOOK_SECRET'] = os.environ.get('WEBHOOK_SECRET', app.config['SECRET_KEY'])
+    from habitica_manager import webhooks
+    if not webhooks.secret_configured(app.config['WEBHOOK_SECRET']):
+        logger.warning("WEBHOOK_SECRET and SECRET_KEY are not set; Habitica webhooks are disabled")
+    
+    # jsonify and request.get_json use orjson
+    from habitica_manager.jsonutil import OrjsonJSONProvider
+    app.json = OrjsonJSONProvider(app)
     
     logger.info("Flask application initialized")
     logger.info(f"Debug mode: {app.config['DEBUG']}")
     
+    # Opt-in request profiling, registered first so it times the other hooks too
+    from habitica_manager import metrics, profiling
+    profiling.init_app(app)
+    
+    # Request counts and latencies for /metrics
+    metrics.init_app(app)
+    
+    # ETags, 304s and gzip/brotli for JSON responses
+    from habitica_manager import http_cache
+    http_cache.init_app(app)
+    
     # Register blueprints
     from habitica_manager.routes import main_bp
     app.register_blueprint(main_bp)
     logger.info("Blueprints registered successfully")
     
+    # Template filters of the server-rendered task lists
+    from habitica_manager import fragments
+    fragments.init_app(app)
+    
+    # Minified, fingerprinted static files (flask assets build)
+    from habitica_manager import assets
+    assets.init_app(app)
+    
+    # flask accounts ... and flask webhooks ... commands
+    from habitica_manager import cli
+    cli.init_app(app)
+    
+    # Services are created on first use, so creating the app builds no clients or threads
+    app_services = services.init_app(app)
+    
+    # Keep the task snapshot and health state fresh in the background. Starting is a
+    # no-op when the threads already run in this process; gunicorn workers also start
+    # them after fork.
+    app.before_request(app_services.start_background)
+    
     return app
-
-# For gunicorn
-app = create_app()
@@ -0,0 +1,132 @@
+"""
+Built static assets: minified, content-hashed and precompressed.
+
+`flask --app wsgi assets build` minifies the CSS and JavaScript under static/,
+names each output after a hash of its content and writes gzip and brotli
+copies next to it, in static/dist with a manifest.json mapping source names to
+built ones. Templates link assets with asset_url(), which takes the same
+filename as url_for('static', ...) and points at the built file when there is
+one. Built files never change under a given name, so they are served with
+`Cache-Control: immutable` and cached by browsers for a year.
+
+Without a build, or with FLASK_DEBUG on, asset_url() links the source files.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import shutil
+from pathlib import Path
+from typing import Dict, List
+
+import brotli
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+logger = logging.getLogger(__name__)
+
+ASSETS_URL = '/assets'
+EXTENSION_KEY = 'habitica_manager_assets'
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# One year, the longest lifetime caches reliably honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Precompressed copies, by content coding
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+def _minify(source: Path) -> str:
+    """Minified contents of a CSS or JavaScript file"""
+    # Only needed when building, so not imported with the app
+    import rcssmin
+    import rjsmin
+
+    text = source.read_text(encoding='utf-8')
+    return rcssmin.cssmin(text) if source.suffix == '.css' else rjsmin.jsmin(text)
+
+def build(static_folder: str) -> Dict[str, str]:
+    """Build every CSS and JavaScript file under static_folder; returns the manifest"""
+    static = Path(static_folder)
+    dist = static / DIST_DIR
+    # Start from scratch so that outputs of earlier builds don't pile up
+    shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    sources = sorted(path for pattern in ('*.css', '*.js') for path in static.rglob(pattern)
+                     if dist not in path.parents)
+    for source in sources:
+        content = _minify(source).encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        name = source.relative_to(static).as_posix()
+        built = f"{name[:-len(source.suffix)]}.{digest}{source.suffix}"
+
+        target = dist / built
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        # mtime=0 keeps the gzip output the same for the same input
+        (dist / f'{built}.gz').write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+        (dist / f'{built}.br').write_bytes(brotli.compress(content, quality=11))
+
+        manifest[name] = built
+        logger.info(f"Built {name} -> {built} ({source.stat().st_size} -> {len(content)} bytes)")
+
+    (dist / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+def load_manifest(static_folder: str) -> Dict[str, str]:
+    """Source name -> built name, or an empty dict if the assets haven't been built"""
+    try:
+        return json.loads((Path(static_folder) / DIST_DIR / MANIFEST).read_text())
+    except FileNotFoundError:
+        return {}
+
+def asset_url(filename: str) -> str:
+    """URL of a static file, the built copy when there is one"""
+    built = current_app.extensions[EXTENSION_KEY].get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('assets', filename=built)
+
+def built_names() -> List[str]:
+    """Names of the built assets linked by pages, which change with every build of changed sources"""
+    return sorted(current_app.extensions[EXTENSION_KEY].values())
+
+def send_asset(filename: str):
+    """Serve a built asset, precompressed if the client accepts it"""
+    dist = Path(current_app.static_folder) / DIST_DIR
+    coding = request.accept_encodings.best_match(tuple(ENCODING_SUFFIXES))
+    path = filename
+    if coding and (dist / f'{filename}{ENCODING_SUFFIXES[coding]}').is_file():
+        path = f'{filename}{ENCODING_SUFFIXES[coding]}'
+
+    mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+    response = send_from_directory(dist, path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if path != filename:
+        response.headers['Content-Encoding'] = coding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+assets_cli = AppGroup('assets', help='Build the static assets.')
+
+@assets_cli.command('build')
+def build_command():
+    """Minify, fingerprint and precompress the CSS and JavaScript"""
+    manifest = build(current_app.static_folder)
+    for name, built in manifest.items():
+        click.echo(f"{name} -> {DIST_DIR}/{built}")
+
+def init_app(app):
+    """Serve built assets and provide asset_url() to templates"""
+    # Debug runs link the source files, so edits show up without a build
+    manifest = {} if app.debug else load_manifest(app.static_folder)
+    if manifest:
+        logger.info(f"Serving {len(manifest)} built static assets")
+    app.extensions[EXTENSION_KEY] = manifest
+    app.add_url_rule(f'{ASSETS_URL}/<path:filename>', 'assets', send_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.cli.add_command(assets_cli)
@@ -0,0 +1,156 @@
+"""
+Response caches for Habitica API reads.
+
+Entries are kept after they expire so they can be revalidated with a
+conditional request (If-None-Match) instead of re-downloading the payload.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .database import get_connection, transaction
+from .jsonutil import dumps, loads
+from .metrics import time_query
+
+logger = logging.getLogger(__name__)
+
+class CacheEntry:
+    """A cached response body with its ETag and expiry time"""
+    
+    __slots__ = ('value', 'etag', 'expires_at')
+    
+    def __init__(self, value: Any, etag: Optional[str], expires_at: float):
+        self.value = value
+        self.etag = etag
+        self.expires_at = expires_at
+    
+    def is_fresh(self) -> bool:
+        """Check whether the entry can be served without revalidation"""
+        return time.time() < self.expires_at
+
+class MemoryCache:
+    """In-process LRU cache with a TTL and a bounded number of entries"""
+    
+    def __init__(self, ttl: float = 30, max_size: int = 128):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Get an entry, fresh or stale, marking it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def set(self, key: str, value: Any, etag: Optional[str] = None):
+        """Store a value, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = CacheEntry(value, etag, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def touch(self, key: str):
+        """Extend the lifetime of an entry that was revalidated upstream"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = time.time() + self.ttl
+    
+    def invalidate(self, prefix: str = ''):
+        """Remove all entries whose key starts with prefix"""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+class SQLiteCache:
+    """Cache stored in the application database, shared by all gunicorn workers.
+    
+    Keys are prefixed with the namespace (the account ID), and max_size applies
+    per namespace, so accounts neither see nor evict each other's entries.
+    """
+    
+    def __init__(self, ttl: float = 30, max_size: int = 128, namespace: str = ''):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.prefix = f'{namespace}:'
+    
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Get an entry, fresh or stale"""
+        with time_query('cache_get'):
+            row = get_connection().execute(
+                'SELECT value, etag, expires_at FROM response_cache WHERE key = ?', (self.prefix + key,)
+            ).fetchone()
+        
+        if row is None:
+            return None
+        return CacheEntry(loads(row[0]), row[1], row[2])
+    
+    def set(self, key: str, value: Any, etag: Optional[str] = None):
+        """Store a value, evicting the oldest entries if full"""
+        with time_query('cache_set'), transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, etag, expires_at) VALUES (?, ?, ?, ?)',
+                (self.prefix + key, dumps(value), etag, time.time() + self.ttl)
+            )
+            conn.execute(
+                'DELETE FROM response_cache WHERE substr(key, 1, ?) = ? AND key NOT IN '
+                '(SELECT key FROM response_cache WHERE substr(key, 1, ?) = ? ORDER BY expires_at DESC LIMIT ?)',
+                (len(self.prefix), self.prefix, len(self.prefix), self.prefix, self.max_size)
+            )
+    
+    def touch(self, key: str):
+        """Extend the lifetime of an entry that was revalidated upstream"""
+        get_connection().execute('UPDATE response_cache SET expires_at = ? WHERE key = ?',
+                                 (time.time() + self.ttl, self.prefix + key))
+    
+    def invalidate(self, prefix: str = ''):
+        """Remove all entries whose key starts with prefix"""
+        prefix = self.prefix + prefix
+        get_connection().execute('DELETE FROM response_cache WHERE substr(key, 1, ?) = ?',
+                                 (len(prefix), prefix))
+
+class NullCache:
+    """Cache that stores nothing, used when caching is disabled"""
+    
+    def get(self, key: str) -> Optional[CacheEntry]:
+        return None
+    
+    def set(self, key: str, value: Any, etag: Optional[str] = None):
+        pass
+    
+    def touch(self, key: str):
+        pass
+    
+    def invalidate(self, prefix: str = ''):
+        pass
+
+CACHE_BACKENDS = {
+    'memory': MemoryCache,
+    'sqlite': SQLiteCache,
+}
+
+def create_cache(backend: Optional[str] = None, namespace: str = ''):
+    """Create the response cache configured by the environment for one account"""
+    backend = (backend or os.getenv('HABITICA_CACHE_BACKEND', 'memory')).lower()
+    if backend == 'none':
+        logger.info("Habitica response cache disabled")
+        return NullCache()
+    
+    if backend not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown HABITICA_CACHE_BACKEND '{backend}'. Expected one of: memory, sqlite, none")
+    
+    ttl = float(os.getenv('HABITICA_CACHE_TTL', '30'))
+    max_size = int(os.getenv('HABITICA_CACHE_SIZE', '128'))
+    logger.info(f"Habitica response cache: {backend} (ttl: {ttl}s, size: {max_size})")
+    if backend == 'sqlite':
+        # Memory caches belong to one service instance; the shared table needs a key prefix
+        return SQLiteCache(ttl=ttl, max_size=max_size, namespace=namespace)
+    return CACHE_BACKENDS[backend](ttl=ttl, max_size=max_size)
@@ -0,0 +1,118 @@
+"""
+Command line tools, run through the flask command:
+
+    flask --app wsgi accounts list
+    flask --app wsgi accounts add alice --user-id <uuid> [--name Alice]
+    flask --app wsgi accounts key alice
+    flask --app wsgi accounts remove alice
+    flask --app wsgi webhooks register https://hbm.example.com [--account alice]
+    flask --app wsgi webhooks remove [--account alice]
+"""
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from . import accounts, task_store, webhooks
+from .database import DEFAULT_ACCOUNT
+from .errors import HabiticaAPIError
+
+accounts_cli = AppGroup('accounts', help='Manage the Habitica accounts served by this deployment.')
+
+@accounts_cli.command('list')
+def list_accounts():
+    """List the configured accounts"""
+    for account in accounts.list_accounts():
+        name = f" ({account['name']})" if account['name'] else ''
+        locked = accounts.access_key_hash(account['id']) is not None
+        access = '' if locked or account['id'] == DEFAULT_ACCOUNT else ' [no access key]'
+        click.echo(f"{account['id']}{name}: user {account['user_id_preview']}{access}")
+
+@accounts_cli.command('add')
+@click.argument('account_id')
+@click.option('--user-id', required=True, help='Habitica User ID')
+@click.option('--api-token', prompt=True, hide_input=True, help='Habitica API Token (prompted if not given)')
+@click.option('--name', help='Display name')
+@click.option('--api-url', help='Habitica API URL, if not HABITICA_API_URL')
+def add_account(account_id, user_id, api_token, name, api_url):
+    """Add an account, or replace the credentials of an existing one"""
+    try:
+        accounts.save_account(account_id, user_id, api_token, name=name, api_url=api_url)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Saved account '{account_id}'. Running workers pick up changed credentials when restarted.")
+    if accounts.access_key_hash(account_id) is None:
+        _echo_access_key(account_id, accounts.issue_access_key(account_id))
+    if accounts.default_account_open():
+        click.echo(f"Set HABITICA_ACCESS_KEY so that '{account_id}' can't open the '{DEFAULT_ACCOUNT}' account.")
+
+@accounts_cli.command('key')
+@click.argument('account_id')
+def rotate_access_key(account_id):
+    """Issue a new access key for an account, signing out everyone using the old one"""
+    try:
+        access_key = accounts.issue_access_key(account_id)
+    except (ValueError, accounts.AccountNotFound) as e:
+        raise click.ClickException(str(e))
+    _echo_access_key(account_id, access_key)
+
+def _echo_access_key(account_id, access_key):
+    click.echo(f"Access key for '{account_id}' (shown only once): {access_key}")
+
+@accounts_cli.command('remove')
+@click.argument('account_id')
+def remove_account(account_id):
+    """Remove an account with its stored tasks"""
+    try:
+        deleted = accounts.delete_account(account_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if not deleted:
+        raise click.ClickException(f"Unknown account '{account_id}'")
+    click.echo(f"Removed account '{account_id}'")
+
+webhooks_cli = AppGroup('webhooks', help='Manage the Habitica webhooks that push task changes.')
+
+def _habitica_service(account_id):
+    """Habitica client for an account, for one command"""
+    # Imported here so that creating the app doesn't load the HTTP client
+    from .habitica_service import HabiticaService
+    try:
+        return HabiticaService(account=accounts.get_account(account_id))
+    except accounts.AccountNotFound as e:
+        raise click.ClickException(str(e))
+
+@webhooks_cli.command('register')
+@click.argument('base_url')
+@click.option('--account', 'account_id', default=DEFAULT_ACCOUNT, show_default=True)
+def register_webhook(base_url, account_id):
+    """Have Habitica push task changes to this deployment, reachable at BASE_URL"""
+    if not webhooks.secret_configured(current_app.config['WEBHOOK_SECRET']):
+        raise click.ClickException('Set WEBHOOK_SECRET or SECRET_KEY to a secret value before registering webhooks')
+    url = webhooks.webhook_url(base_url, current_app.config['WEBHOOK_SECRET'], account_id)
+    service = _habitica_service(account_id)
+    try:
+        service.register_webhook(url, webhooks.WEBHOOK_LABEL)
+    except HabiticaAPIError as e:
+        raise click.ClickException(str(e))
+    # Tells the scheduler to rely on webhooks and sync rarely
+    task_store.log_sync('webhook', 'registered', base_url, account_id=account_id)
+    click.echo(f"Registered webhook for account '{account_id}' at {base_url.rstrip('/')}{webhooks.WEBHOOK_PATH}")
+
+@webhooks_cli.command('remove')
+@click.option('--account', 'account_id', default=DEFAULT_ACCOUNT, show_default=True)
+def remove_webhook(account_id):
+    """Stop Habitica pushing task changes; the tasks are polled again"""
+    service = _habitica_service(account_id)
+    try:
+        deleted = service.delete_webhook(webhooks.WEBHOOK_LABEL)
+    except HabiticaAPIError as e:
+        raise click.ClickException(str(e))
+    task_store.log_sync('webhook', 'removed', 'Webhook removed', account_id=account_id)
+    click.echo(f"Removed webhook for account '{account_id}'" if deleted else
+               f"No webhook was registered for account '{account_id}'")
+
+def init_app(app):
+    """Register the command groups"""
+    app.cli.add_command(accounts_cli)
+    app.cli.add_command(webhooks_cli)
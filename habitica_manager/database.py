@@ -1,12 +1,43 @@
 import sqlite3
 import os
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Milliseconds a connection waits for another writer's lock before failing
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+# Page cache per connection (KiB)
+CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))
+# Bytes of the database file to memory-map for reads
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)))
+# NORMAL is durable against application crashes in WAL mode; FULL also survives power loss
+SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+
+# Stored in PRAGMA user_version once the schema is set up; bump it whenever
+# init_database() gains a table, column or index so existing databases get it
+SCHEMA_VERSION = 6
+
+# Account served with the HABITICA_USER_ID/HABITICA_API_TOKEN credentials from the environment
+DEFAULT_ACCOUNT = 'default'
+
+# Each thread keeps one open connection, reused across calls
+_local = threading.local()
+# Connections inherited across a fork; SQLite must not close them in the child
+_inherited_connections = []
+
 def get_db_path():
     """Get the path to the SQLite database file"""
+    # DATABASE_PATH points the app at another database, e.g. for benchmarks
+    override = os.getenv('DATABASE_PATH')
+    if override:
+        path = Path(override)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+    
     # Get the project root directory (parent of habitica_manager)
     project_root = Path(__file__).parent.parent
     data_dir = project_root / "data"
@@ -16,20 +47,110 @@ def get_db_path():
     
     return data_dir / "hbm.db"
 
+def _ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing; returns True if it was added"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column in [row[1] for row in cursor.fetchall()]:
+        return False
+    logger.info(f"Adding column {table}.{column}")
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+# Text indexed for search for the tasks row NEW: checklist item texts and tag names, space
+# separated. They are read from the compact summary, which is much quicker to parse than the full JSON.
+_SEARCH_CHECKLIST = """(SELECT group_concat(json_extract(item.value, '$.text'), ' ')
+                       FROM json_each(COALESCE(NEW.summary, NEW.data), '$.checklist') AS item)"""
+_SEARCH_TAGS = """(SELECT group_concat(tags.name, ' ')
+                  FROM json_each(COALESCE(NEW.summary, NEW.data), '$.tags') AS tag
+                  JOIN tags ON tags.account_id = NEW.account_id AND tags.id = tag.value)"""
+
+def _create_search_index(cursor):
+    """Create the full-text index of tasks and the triggers that keep it up to date.
+    
+    tasks_fts holds one row per task, under the task's rowid, with its text,
+    notes, checklist item texts and tag names. Triggers on tasks and tags
+    rewrite a task's row whenever anything indexed changes, so the index is
+    never rebuilt as a whole; it is only filled from the stored tasks when it
+    is first created. (A VACUUM may renumber the rowids of tasks, after which
+    tasks_fts would have to be dropped and created again.)
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'")
+    created = cursor.fetchone() is None
+    # Prefix indexes make 'gro*' style queries (used for every search term) as cheap as whole words
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            text, notes, checklist, tags,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    if created:
+        # Rank matches in the task text above the same matches in notes, checklists and tags
+        cursor.execute("INSERT INTO tasks_fts (tasks_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0, 3.0)')")
+    
+    # REPLACE conflicts on tasks delete the old row through the delete trigger, as
+    # connections enable recursive_triggers (see _connect)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, text, notes, checklist, tags)
+            VALUES (NEW.rowid, NEW.text, NEW.notes, {_SEARCH_CHECKLIST}, {_SEARCH_TAGS});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF text, notes, summary, data ON tasks BEGIN
+            UPDATE tasks_fts SET text = NEW.text, notes = NEW.notes,
+                checklist = {_SEARCH_CHECKLIST}, tags = {_SEARCH_TAGS}
+            WHERE rowid = NEW.rowid;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            DELETE FROM tasks_fts WHERE rowid = OLD.rowid;
+        END
+    ''')
+    # A renamed, new or removed tag changes the indexed tag names of the tasks carrying it;
+    # rewriting the tasks' data fires tasks_fts_update for them
+    for event, row in (('INSERT', 'NEW'), ('UPDATE OF name', 'NEW'), ('DELETE', 'OLD')):
+        name = 'tags_fts_' + event.split()[0].lower()
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON tags BEGIN
+                UPDATE tasks SET data = data
+                WHERE account_id = {row}.account_id
+                AND id IN (SELECT task_id FROM task_tags WHERE tag_id = {row}.id);
+            END
+        ''')
+    
+    if created:
+        cursor.execute(f'''
+            INSERT INTO tasks_fts (rowid, text, notes, checklist, tags)
+            SELECT NEW.rowid, NEW.text, NEW.notes, {_SEARCH_CHECKLIST}, {_SEARCH_TAGS} FROM tasks AS NEW
+        ''')
+        logger.info(f"Indexed {cursor.rowcount} stored tasks for search")
+
 def init_database():
     """Initialize the SQLite database with required tables"""
     db_path = get_db_path()
     
-    # Check if database already exists
+    # Tables are created with IF NOT EXISTS, so existing databases pick up new tables
     if db_path.exists():
         logger.info(f"Database already exists at {db_path}")
-        return
-    
-    logger.info(f"Creating new database at {db_path}")
+    else:
+        logger.info(f"Creating new database at {db_path}")
     
     try:
+        conn = sqlite3.connect(str(db_path), timeout=BUSY_TIMEOUT_MS / 1000)
+        
+        # Skip the schema checks when this database was already set up by this version
+        if conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+            conn.close()
+            logger.info(f"Database schema is up to date (version {SCHEMA_VERSION})")
+            return
+        
         # Create database and tables
-        conn = sqlite3.connect(str(db_path))
+        # WAL lets readers in other workers run while a sync writes; the setting persists in the file
+        journal_mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            logger.warning(f"Could not enable WAL mode, using journal mode '{journal_mode}'")
         cursor = conn.cursor()
         
         # Create tables for storing Habitica data locally
@@ -108,12 +229,121 @@ def init_database():
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,  -- JSON response body
+                etag TEXT,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        
+        # Named leases used to coordinate work between gunicorn workers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_lock (
+                name TEXT PRIMARY KEY,
+                owner TEXT,
+                expires_at REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Shared token bucket for outbound Habitica requests
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                remaining INTEGER,  -- X-RateLimit-Remaining from the last response
+                reset_at REAL  -- X-RateLimit-Reset as an epoch timestamp
+            )
+        ''')
+        
+        # Tag IDs of each task, for filtering by tag
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS task_tags (
+                task_id TEXT NOT NULL,
+                tag_id TEXT NOT NULL,
+                PRIMARY KEY (task_id, tag_id)
+            )
+        ''')
+        
+        # Names of each account's Habitica tags, for search
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tags (
+                account_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                PRIMARY KEY (account_id, id)
+            )
+        ''')
+        
+        # Habitica accounts served besides the default one; see accounts.py
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS accounts (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL UNIQUE,
+                api_token TEXT NOT NULL,
+                name TEXT,
+                api_url TEXT,  -- Overrides HABITICA_API_URL for this account
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Log of task changes, read by the live update stream
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS task_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                event TEXT NOT NULL,  -- created, updated, deleted or reordered (with an empty task_id)
+                created_at REAL NOT NULL
+            )
+        ''')
+        
+        # Columns added after the original schema
+        _ensure_column(cursor, 'tasks', 'position', 'INTEGER')  # Order within the Habitica task list
+        if _ensure_column(cursor, 'tasks', 'due_date', 'TIMESTAMP'):
+            # Fill the new query columns for tasks stored before they existed
+            cursor.execute("UPDATE tasks SET due_date = json_extract(data, '$.date') WHERE data IS NOT NULL")
+            cursor.execute('''
+                INSERT OR IGNORE INTO task_tags (task_id, tag_id)
+                SELECT tasks.id, tag.value FROM tasks, json_each(tasks.data, '$.tags') AS tag
+                WHERE tasks.data IS NOT NULL
+            ''')
+        if _ensure_column(cursor, 'tasks', 'summary', 'TEXT'):  # Compact JSON for list views
+            # Clearing updated_at makes the next sync rewrite every row, filling in the summary
+            cursor.execute('UPDATE tasks SET updated_at = NULL')
+        _ensure_column(cursor, 'sync_log', 'duration_ms', 'REAL')
+        # task_events sequence number of the task's latest change; NULL for tasks stored before versions
+        _ensure_column(cursor, 'tasks', 'version', 'INTEGER')
+        # SHA-256 of the key that opens the account in the web UI and API; see accounts.py
+        _ensure_column(cursor, 'accounts', 'access_key_hash', 'TEXT')
+        # Rows stored before multi-account support belong to the default account
+        for table in ('tasks', 'habits', 'dailies', 'todos', 'sync_log'):
+            _ensure_column(cursor, table, 'account_id', f"TEXT NOT NULL DEFAULT '{DEFAULT_ACCOUNT}'")
+        
         # Create indexes for better performance
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_type ON tasks(type)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_completed ON tasks(completed)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_due_date ON todos(due_date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_log_time ON sync_log(sync_time)')
+        # Every task query is scoped to one account, so the query indexes lead with it
+        for index in ('idx_tasks_position', 'idx_tasks_type_completed', 'idx_tasks_due_date'):
+            cursor.execute(f'DROP INDEX IF EXISTS {index}')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_account_position ON tasks(account_id, type, position)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_account_completed '
+                       'ON tasks(account_id, type, completed, position)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_account_due_date ON tasks(account_id, type, due_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_log_account '
+                       'ON sync_log(account_id, sync_type, status, sync_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_tags_tag ON task_tags(tag_id, task_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_events_account ON task_events(account_id, seq)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_events_time ON task_events(created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_account_version ON tasks(account_id, version)')
+        
+        _create_search_index(cursor)
         
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
         conn.close()
         
@@ -123,27 +353,97 @@ def init_database():
         logger.error(f"Error initializing database: {e}")
         raise
 
+def _connect():
+    """Open a connection with the application's pragmas"""
+    conn = sqlite3.connect(str(get_db_path()), timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA synchronous = {SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    # Lets the rows an INSERT OR REPLACE removes fire delete triggers, which keep the search index in step
+    conn.execute('PRAGMA recursive_triggers = ON')
+    return conn
+
 def get_connection():
-    """Get a database connection"""
-    db_path = get_db_path()
-    return sqlite3.connect(str(db_path))
+    """Get this thread's database connection.
+    
+    Connections are opened in autocommit mode and reused for the life of the
+    thread, so callers must not close them. Use transaction() to group writes.
+    """
+    pid = os.getpid()
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == pid:
+        return conn
+    
+    if conn is not None:
+        # Opened before a fork (e.g. by a preloaded gunicorn app); keep it referenced
+        # so it is never closed here, and open a new one for this process
+        _inherited_connections.append(conn)
+    
+    conn = _connect()
+    _local.conn = conn
+    _local.pid = pid
+    return conn
+
+def close_connection():
+    """Close this thread's connection, if it has one"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+@contextmanager
+def transaction(immediate=True):
+    """Run a block in a transaction on this thread's connection.
+    
+    Commits when the block exits and rolls back if it raises. Immediate
+    transactions take the write lock up front, so a read followed by a write
+    can't fail halfway with 'database is locked'; pass immediate=False for a
+    consistent multi-statement read. Nested blocks join the outer transaction.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def acquire_lock(name, owner, ttl):
+    """Acquire or renew a named lease; returns True if owner now holds it"""
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('INSERT OR IGNORE INTO sync_lock (name, owner, expires_at) VALUES (?, NULL, 0)', (name,))
+        cursor = conn.execute(
+            'UPDATE sync_lock SET owner = ?, expires_at = ? WHERE name = ? AND (owner = ? OR expires_at < ?)',
+            (owner, now + ttl, name, owner, now)
+        )
+        return cursor.rowcount == 1
+
+def release_lock(name, owner):
+    """Release a named lease if owner holds it"""
+    get_connection().execute('UPDATE sync_lock SET expires_at = 0 WHERE name = ? AND owner = ?', (name, owner))
 
 def test_connection():
     """Test database connection and return basic info"""
     try:
         db_path = get_db_path()
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
+        conn = get_connection()
         
         # Get table count
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        conn.close()
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
         
         return {
             'success': True,
             'db_path': str(db_path),
+            'journal_mode': journal_mode,
             'table_count': len(tables),
             'tables': [table[0] for table in tables]
         }
@@ -0,0 +1,10 @@
+"""
+Exceptions shared by the Habitica client and the routes.
+
+Kept free of heavy imports so the routes can catch them without loading
+requests at startup.
+"""
+
+class HabiticaAPIError(Exception):
+    """Custom exception for Habitica API errors"""
+    pass
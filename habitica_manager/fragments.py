@@ -0,0 +1,73 @@
+"""
+Server-rendered task lists for the home page.
+
+Each account's todo, habit and daily lists are rendered from the
+_task_list.html template and kept in an in-process cache keyed by the data
+version, so while nothing changes a page view costs a lookup per list. Any
+stored change, reorders included, advances the version and the lists are
+rendered again on the next view.
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import Dict
+
+from flask import render_template
+from markupsafe import Markup
+
+from . import task_store
+from .cache import MemoryCache
+
+logger = logging.getLogger(__name__)
+
+# Task type -> text shown for an empty list
+TASK_LISTS = {
+    'todo': 'No todo tasks found',
+    'habit': 'No habits found',
+    'daily': 'No daily tasks found'
+}
+
+# Rendered lists kept per worker; entries of older versions are evicted as new ones come in
+_fragments = MemoryCache(ttl=float('inf'), max_size=int(os.getenv('FRAGMENT_CACHE_SIZE', '48')))
+
+def render_task_lists(account_id: str, version: int) -> Dict[str, Markup]:
+    """HTML of an account's task lists by task type, as of version.
+
+    Read the version before calling, so a change made meanwhile is rendered
+    again rather than cached under a version it doesn't belong to.
+    """
+    lists = {}
+    for task_type, empty_text in TASK_LISTS.items():
+        key = f'{account_id}:{task_type}:{version}'
+        entry = _fragments.get(key)
+        if entry is None:
+            tasks, _ = task_store.query_tasks(types=[task_type], account_id=account_id)
+            html = Markup(render_template('_task_list.html', tasks=tasks, task_type=task_type,
+                                          empty_text=empty_text))
+            _fragments.set(key, html)
+            lists[task_type] = html
+        else:
+            lists[task_type] = entry.value
+    return lists
+
+def task_date(value: str) -> str:
+    """Format a due date like the dashboard does, e.g. 'Oct 16, 2026'"""
+    try:
+        day = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return value
+    return f'{day:%b} {day.day}, {day.year}'
+
+def priority_level(priority: float) -> str:
+    """Priority indicator class suffix of a task priority"""
+    if priority >= 2:
+        return 'high'
+    if priority >= 1.5:
+        return 'medium'
+    return 'low'
+
+def init_app(app):
+    """Register the template filters used by the task list fragments"""
+    app.jinja_env.filters['task_date'] = task_date
+    app.jinja_env.filters['priority_level'] = priority_level
@@ -5,24 +5,114 @@ Habitica API service for interacting with the Habitica REST API.
 import os
 import requests
 import logging
-from typing import Dict, List, Optional
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import metrics
+from .profiling import phase
+from .cache import create_cache
+from .database import DEFAULT_ACCOUNT
+from .errors import HabiticaAPIError
+from .jsonutil import loads
+from .rate_limit import RateLimiter, RateLimitTimeout, backoff_delay
 
 logger = logging.getLogger(__name__)
 
-class HabiticaAPIError(Exception):
-    """Custom exception for Habitica API errors"""
-    pass
+# Methods that are safe to retry automatically on connection failures
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
 
-class HabiticaService:
-    """Service class for interacting with Habitica API"""
+# The full user document is Habitica's largest response; connection checks only need these fields
+USER_CHECK_FIELDS = 'auth.local.username,stats.lvl,stats.class,stats.exp'
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+    
+    The first caller for a key runs the function; callers arriving while it is
+    still in flight wait for it and share its result (or its exception).
+    """
+    
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
     
     def __init__(self):
-        self.api_url = os.getenv('HABITICA_API_URL', 'https://habitica.com/api/v3')
-        self.user_id = os.getenv('HABITICA_USER_ID')
-        self.api_token = os.getenv('HABITICA_API_TOKEN')
+        self._lock = threading.Lock()
+        self._calls: Dict[str, 'SingleFlight._Call'] = {}
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn once for all concurrent callers using the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        
+        if not leader:
+            logger.debug(f"Joining in-flight request for {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+class HabiticaService:
+    """Service class for interacting with Habitica API.
+    
+    Each instance signs in as one account, with its own connection pool,
+    response cache and rate limit bucket. Without an account it uses the
+    credentials from the environment.
+    """
+    
+    def __init__(self, cache=None, account=None):
+        self.account_id = account.id if account is not None else DEFAULT_ACCOUNT
+        self.api_url = (account is not None and account.api_url) or \
+            os.getenv('HABITICA_API_URL', 'https://habitica.com/api/v3')
+        self.user_id = account.user_id if account is not None else os.getenv('HABITICA_USER_ID')
+        self.api_token = account.api_token if account is not None else os.getenv('HABITICA_API_TOKEN')
+        
+        # Connection pool settings
+        self.timeout = float(os.getenv('HABITICA_TIMEOUT', '10'))
+        self.pool_size = int(os.getenv('HABITICA_POOL_SIZE', '10'))
+        self.max_retries = int(os.getenv('HABITICA_MAX_RETRIES', '3'))
+        
+        # Todos created per request when bulk cloning
+        self.clone_batch_size = int(os.getenv('HABITICA_CLONE_BATCH_SIZE', '25'))
         
         # Validate credentials
         self._validate_credentials()
+        
+        # Headers never change for an instance, so build them once
+        self.headers = self._get_headers()
+        
+        # The session is created lazily per process (see the session property)
+        self._session = None
+        self._session_pid = None
+        
+        # Concurrent reads of the same endpoint share one upstream request
+        self._single_flight = SingleFlight()
+        
+        # Cache for GET responses, invalidated whenever a write succeeds
+        self.cache = cache if cache is not None else create_cache(namespace=self.account_id)
+        
+        # Outbound requests are paced to Habitica's per-user rate limit, so each user has a bucket
+        self.rate_limiter = RateLimiter(self.user_id)
+        
+        # Outcome of the most recent upstream request in this process, for health checks
+        self.last_upstream: Optional[Dict] = None
     
     def _validate_credentials(self):
         """Validate that API credentials are properly configured"""
@@ -50,6 +140,7 @@ class HabiticaService:
     def get_credentials_info(self) -> Dict[str, str]:
         """Get information about configured credentials (for debugging)"""
         return {
+            'account': self.account_id,
             'api_url': self.api_url,
             'user_id_configured': bool(self.user_id and self.user_id != 'your-user-id'),
             'api_token_configured': bool(self.api_token and self.api_token != 'your-api-token'),
@@ -77,82 +168,226 @@ class HabiticaService:
         
         return headers
     
-    def _make_request(self, endpoint: str, method: str = 'GET', data: Optional[Dict] = None) -> Dict:
-        """Make a request to the Habitica API"""
+    def _create_session(self) -> requests.Session:
+        """Create a keep-alive session with a bounded connection pool"""
+        # Connection errors are retried here for idempotent verbs only, since a
+        # retried POST could create duplicate tasks. Retries on 429 and 5xx
+        # responses are handled by _send_request so they respect the rate limit.
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=0.5,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry
+        )
+        
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self.headers)
+        
+        logger.debug(f"Created HTTP session (pool size: {self.pool_size}, retries: {self.max_retries})")
+        return session
+    
+    @property
+    def session(self) -> requests.Session:
+        """Get the pooled HTTP session for the current process"""
+        # Gunicorn forks workers after the app is preloaded, so sockets must never
+        # be shared between processes: each worker gets its own session.
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            self._session = self._create_session()
+            self._session_pid = pid
+        return self._session
+    
+    def close(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+            self._session_pid = None
+    
+    def _send_request(self, endpoint: str, method: str = 'GET', data: Optional[Union[Dict, List]] = None,
+                      headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Send a request to the Habitica API and check the response status"""
         try:
             url = f"{self.api_url}/{endpoint}"
-            headers = self._get_headers()
+            method = method.upper()
             
             # Log request details
             logger.info(f"Making {method} request to Habitica API: {endpoint}")
             #logger.debug(f"Full URL: {url}")
-            #logger.debug(f"Request headers: {headers}")
             #if data:
             #    logger.debug(f"Request data: {data}")
             
-            # Make the appropriate request
-            if method.upper() == 'POST':
-                response = requests.post(url, headers=headers, json=data, timeout=10)
-            elif method.upper() == 'PUT':
-                response = requests.put(url, headers=headers, json=data, timeout=10)
-            elif method.upper() == 'DELETE':
-                response = requests.delete(url, headers=headers, timeout=10)
-            else:  # Default to GET
-                response = requests.get(url, headers=headers, timeout=10)
-            
-            # Log response details
-            logger.debug(f"Response status code: {response.status_code}")
-            #logger.debug(f"Response headers: {dict(response.headers)}")
-            #
-            #try:
-            #    response_json = response.json()
-            #    logger.debug(f"Response body: {response_json}")
-            #except Exception as json_error:
-            #    logger.debug(f"Response text: {response.text}")
-            #    logger.debug(f"JSON parse error: {json_error}")
-            
-            # Check for specific error codes
-            if response.status_code == 401:
-                raise HabiticaAPIError("Invalid Habitica API credentials. Please check your User ID and API Token.")
-            
-            if response.status_code == 400:
-                logger.error("Bad Request Error")
-                raise HabiticaAPIError(f"Bad request to Habitica API: {response.text}")
-            
-            if response.status_code == 404:
-                logger.error("Not Found Error")
-                raise HabiticaAPIError(f"Habitica API endpoint not found: {endpoint}")
-            
-            if response.status_code == 429:
-                logger.warning("Rate Limit Error")
-                raise HabiticaAPIError("Rate limit exceeded. Please wait before making more requests.")
-            
-            if response.status_code >= 500:
-                logger.error(f"Server Error: {response.status_code}")
-                raise HabiticaAPIError(f"Habitica server error: {response.status_code}")
+            attempt = 0
+            while True:
+                # Wait for a slot in the shared rate limit budget
+                try:
+                    with phase('rate_limit'):
+                        self.rate_limiter.acquire()
+                except RateLimitTimeout as e:
+                    raise HabiticaAPIError(f"Rate limit exceeded. {e}")
+                
+                # Only POST and PUT carry a JSON body
+                start = time.perf_counter()
+                with phase('upstream'):
+                    if method in ('POST', 'PUT'):
+                        response = self.session.request(method, url, json=data, headers=headers, timeout=self.timeout)
+                    else:
+                        response = self.session.request(method, url, headers=headers, timeout=self.timeout)
+                
+                # Log response details
+                logger.debug(f"Response status code: {response.status_code}")
+                #logger.debug(f"Response headers: {dict(response.headers)}")
+                
+                self._record_upstream(method, endpoint, response.status_code, time.perf_counter() - start)
+                self.rate_limiter.update(response.headers, response.status_code)
+                
+                if not self._should_retry(response.status_code, method, attempt):
+                    break
+                
+                delay = backoff_delay(attempt)
+                logger.warning(f"Habitica returned {response.status_code} for {endpoint}, "
+                               f"retrying in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries})")
+                time.sleep(delay)
+                attempt += 1
             
-            response.raise_for_status()
-            
-            data = response.json()
-            if not data.get('success', False):
-                logger.error(f"API Error: {data.get('message', 'Unknown error')}")
-                raise HabiticaAPIError(f"API returned error: {data.get('message', 'Unknown error')}")
-            
-            logger.debug("Request successful, returning data")
-            return data.get('data', {})
+            self._check_status(response, endpoint)
+            return response
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Network Error: {e}")
+            self._record_upstream(method, endpoint, None, None, str(e))
             if "401" in str(e):
                 raise HabiticaAPIError("Invalid Habitica API credentials. Please check your User ID and API Token.")
             raise HabiticaAPIError(f"Failed to connect to Habitica API: {e}")
     
+    def _record_upstream(self, method: str, endpoint: str, status_code: Optional[int],
+                         seconds: Optional[float], error: Optional[str] = None):
+        """Record the outcome of an upstream request (status None for network errors)"""
+        metrics.observe_upstream(method, endpoint, status_code or 'error', seconds)
+        latency_ms = seconds * 1000 if seconds is not None else None
+        self.last_upstream = {
+            # Bad credentials count as a failure; other 4xx responses are about the request
+            'ok': status_code is not None and status_code < 500 and status_code != 401,
+            'status_code': status_code,
+            'latency_ms': round(latency_ms, 1) if latency_ms is not None else None,
+            'error': error,
+            'checked_at': time.time()
+        }
+    
+    def _should_retry(self, status_code: int, method: str, attempt: int) -> bool:
+        """Decide whether a response status is worth another attempt"""
+        if attempt >= self.max_retries:
+            return False
+        # A 429 was never processed, so any method can be retried once the
+        # budget resets; server errors are only retried for idempotent verbs
+        return status_code == 429 or (status_code >= 500 and method in IDEMPOTENT_METHODS)
+    
+    def _check_status(self, response, endpoint: str):
+        """Raise HabiticaAPIError for error responses"""
+        # Check for specific error codes
+        if response.status_code == 401:
+            raise HabiticaAPIError("Invalid Habitica API credentials. Please check your User ID and API Token.")
+        
+        if response.status_code == 400:
+            logger.error("Bad Request Error")
+            raise HabiticaAPIError(f"Bad request to Habitica API: {response.text}")
+        
+        if response.status_code == 404:
+            logger.error("Not Found Error")
+            raise HabiticaAPIError(f"Habitica API endpoint not found: {endpoint}")
+        
+        if response.status_code == 429:
+            logger.warning("Rate Limit Error")
+            raise HabiticaAPIError("Rate limit exceeded. Please wait before making more requests.")
+        
+        if response.status_code >= 500:
+            logger.error(f"Server Error: {response.status_code}")
+            raise HabiticaAPIError(f"Habitica server error: {response.status_code}")
+        
+        if response.status_code >= 400:
+            logger.error(f"Client Error: {response.status_code}")
+            raise HabiticaAPIError(f"Habitica API request failed with status {response.status_code}")
+    
+    def _parse_response(self, response) -> Dict:
+        """Unwrap the data from a Habitica API response envelope"""
+        try:
+            data = loads(response.content)
+        except ValueError as e:
+            logger.error(f"Invalid JSON in API response: {e}")
+            raise HabiticaAPIError(f"Invalid response from Habitica API: {e}")
+        
+        if not data.get('success', False):
+            logger.error(f"API Error: {data.get('message', 'Unknown error')}")
+            raise HabiticaAPIError(f"API returned error: {data.get('message', 'Unknown error')}")
+        
+        logger.debug("Request successful, returning data")
+        return data.get('data', {})
+    
+    def _make_request(self, endpoint: str, method: str = 'GET', data: Optional[Union[Dict, List]] = None) -> Any:
+        """Make a request to the Habitica API"""
+        response = self._send_request(endpoint, method, data)
+        result = self._parse_response(response)
+        
+        # Any successful write may change what cached reads would return
+        if method.upper() != 'GET':
+            self.invalidate_cache()
+        
+        return result
+    
+    def _cached_request(self, endpoint: str, fresh: bool = False) -> Dict:
+        """Make a GET request served from the response cache when possible
+
+        With fresh=True an unexpired entry is not trusted: Habitica is always asked, with
+        If-None-Match, so an unchanged response still costs no body.
+        """
+        entry = self.cache.get(endpoint)
+        if fresh:
+            # Not shared with in-flight reads, which may have started before a change was made
+            return self._revalidate(endpoint, entry)
+        if entry is not None and entry.is_fresh():
+            logger.debug(f"Cache hit for {endpoint}")
+            metrics.CACHE_LOOKUPS.labels('hit').inc()
+            return entry.value
+        metrics.CACHE_LOOKUPS.labels('miss').inc()
+        
+        # Concurrent misses for the same endpoint share one upstream request
+        return self._single_flight.do(endpoint, lambda: self._revalidate(endpoint, entry))
+    
+    def _revalidate(self, endpoint: str, entry) -> Dict:
+        """Fetch an endpoint, using a conditional request if a stale entry has an ETag"""
+        headers = {'If-None-Match': entry.etag} if entry is not None and entry.etag else None
+        response = self._send_request(endpoint, headers=headers)
+        
+        if response.status_code == 304 and entry is not None:
+            logger.debug(f"Cached {endpoint} still valid (304 Not Modified)")
+            metrics.CACHE_REVALIDATIONS.labels('not_modified').inc()
+            self.cache.touch(endpoint)
+            return entry.value
+        if headers is not None:
+            metrics.CACHE_REVALIDATIONS.labels('modified').inc()
+        
+        result = self._parse_response(response)
+        self.cache.set(endpoint, result, etag=response.headers.get('ETag'))
+        return result
+    
+    def invalidate_cache(self):
+        """Drop all cached reads, e.g. after a task was created or changed"""
+        logger.debug("Invalidating Habitica response cache")
+        self.cache.invalidate()
+    
     def test_connection(self) -> Dict:
         """Test the connection to Habitica API with minimal data request"""
         logger.info("Testing Habitica API Connection")
         try:
-            # Make a simple request to test authentication
-            result = self._make_request('user')
+            # Request only the fields the connection check shows, not the whole user document
+            result = self._cached_request(f'user?userFields={USER_CHECK_FIELDS}')
             logger.info("Connection test successful!")
             return {
                 'success': True,
@@ -167,10 +402,16 @@ class HabiticaService:
                 'user_data': None
             }
     
-    def get_tasks(self) -> Dict[str, List]:
-        """Get all tasks (todos, habits, dailies) from Habitica"""
-        raw_tasks = self._make_request('tasks/user')
-        
+    def get_raw_tasks(self, fresh: bool = False) -> List[Dict]:
+        """Get the user's task list from Habitica, in Habitica order; fresh=True skips the cache TTL"""
+        return self._cached_request('tasks/user', fresh=fresh)
+    
+    def get_tags(self, fresh: bool = False) -> List[Dict]:
+        """Get the user's tags (id and name) from Habitica; fresh=True skips the cache TTL"""
+        return self._cached_request('tags', fresh=fresh)
+    
+    def _split_tasks(self, raw_tasks: List[Dict]) -> Dict[str, List]:
+        """Group a flat task list by type"""
         logger.info(f"Task Processing: {len(raw_tasks)} total tasks received")
         
         # The API returns a flat list, so we need to separate by type
@@ -194,6 +435,10 @@ class HabiticaService:
             'dailys': dailies  # Note: Habitica API uses 'dailys' not 'dailies'
         }
     
+    def get_tasks(self) -> Dict[str, List]:
+        """Get all tasks (todos, habits, dailies) from Habitica"""
+        return self._split_tasks(self.get_raw_tasks())
+    
     def get_todos(self) -> List[Dict]:
         """Get todo tasks from Habitica"""
         tasks = self.get_tasks()
@@ -209,6 +454,30 @@ class HabiticaService:
         tasks = self.get_tasks()
         return tasks.get('dailys', [])
     
+    def _build_clone_data(self, original_todo: Dict) -> Dict:
+        """Build the request body for a copy of a todo"""
+        new_todo_data = {
+            'text': original_todo['text'],
+            'type': 'todo',
+            'notes': original_todo.get('notes', ''),
+            'priority': original_todo.get('priority', 1),
+            'date': original_todo.get('date'),
+            'reminders': original_todo.get('reminders', []),
+            'tags': original_todo.get('tags', [])
+        }
+        
+        # Clone checklist if it exists
+        if original_todo.get('checklist'):
+            new_todo_data['checklist'] = [
+                {
+                    'text': item['text'],
+                    'completed': False  # Start with uncompleted checklist items
+                }
+                for item in original_todo['checklist']
+            ]
+        
+        return new_todo_data
+    
     def clone_todo(self, todo_id: str) -> Dict:
         """Clone a todo task by creating a copy with the same properties"""
         try:
@@ -219,25 +488,7 @@ class HabiticaService:
             logger.info(f"Retrieved original todo: {original_todo.get('text', 'Unknown')}")
             
             # Prepare the new todo data
-            new_todo_data = {
-                'text': original_todo['text'],
-                'type': 'todo',
-                'notes': original_todo.get('notes', ''),
-                'priority': original_todo.get('priority', 1),
-                'date': original_todo.get('date'),
-                'reminders': original_todo.get('reminders', []),
-                'tags': original_todo.get('tags', [])
-            }
-            
-            # Clone checklist if it exists
-            if original_todo.get('checklist'):
-                new_todo_data['checklist'] = [
-                    {
-                        'text': item['text'],
-                        'completed': False  # Start with uncompleted checklist items
-                    }
-                    for item in original_todo['checklist']
-                ]
+            new_todo_data = self._build_clone_data(original_todo)
             
             logger.info(f"Creating new todo with data: {new_todo_data}")
             
@@ -251,6 +502,95 @@ class HabiticaService:
             logger.error(f"Error cloning todo {todo_id}: {e}")
             raise HabiticaAPIError(f"Failed to clone todo: {str(e)}")
     
+    def clone_todos(self, items: List[Tuple[str, int]], batch_size: Optional[int] = None) -> Iterator[Dict]:
+        """Clone several todos, each a number of times, yielding progress events.
+        
+        The originals come from a single tasks/user fetch (todos missing from it,
+        such as completed ones, are fetched individually) and the copies are
+        created with array-body POSTs of up to batch_size todos. Events are dicts
+        with an 'event' key: 'start', 'created', 'error' and finally 'done'.
+        """
+        batch_size = batch_size or self.clone_batch_size
+        wanted = {todo_id for todo_id, _ in items}
+        originals = {task['id']: task for task in self.get_raw_tasks() if task.get('id') in wanted}
+        
+        bodies = []  # (source todo ID, new todo data)
+        failed = 0
+        for todo_id, copies in items:
+            original = originals.get(todo_id)
+            if original is None:
+                try:
+                    original = originals[todo_id] = self._make_request(f'tasks/{todo_id}')
+                except HabiticaAPIError as e:
+                    logger.error(f"Error fetching todo {todo_id} to clone: {e}")
+                    failed += copies
+                    yield {'event': 'error', 'todo_ids': [todo_id], 'message': str(e)}
+                    continue
+            
+            if original.get('type') != 'todo':
+                failed += copies
+                yield {'event': 'error', 'todo_ids': [todo_id], 'message': 'Task is not a todo'}
+                continue
+            
+            bodies.extend((todo_id, self._build_clone_data(original)) for _ in range(copies))
+        
+        logger.info(f"Bulk cloning {len(bodies)} todos in batches of {batch_size}")
+        yield {'event': 'start', 'total': len(bodies)}
+        
+        created = 0
+        for start in range(0, len(bodies), batch_size):
+            batch = bodies[start:start + batch_size]
+            try:
+                result = self._make_request('tasks/user', method='POST', data=[body for _, body in batch])
+            except HabiticaAPIError as e:
+                logger.error(f"Error creating batch of {len(batch)} cloned todos: {e}")
+                failed += len(batch)
+                yield {'event': 'error', 'todo_ids': [todo_id for todo_id, _ in batch], 'message': str(e)}
+                continue
+            
+            # A single created task comes back as an object rather than a list
+            if isinstance(result, dict):
+                result = [result]
+            
+            for (todo_id, _), task in zip(batch, result):
+                created += 1
+                yield {'event': 'created', 'todo_id': todo_id, 'task': task}
+        
+        logger.info(f"Bulk clone finished: {created} created, {failed} failed")
+        yield {'event': 'done', 'created': created, 'failed': failed}
+    
+    def get_webhooks(self) -> List[Dict]:
+        """Get the webhooks registered for the user"""
+        return self._make_request('user/webhook')
+    
+    def _webhook_body(self, url: str, label: str) -> Dict:
+        """Build the request body of a taskActivity webhook reporting every task change"""
+        return {
+            'url': url,
+            'label': label,
+            'type': 'taskActivity',
+            'enabled': True,
+            'options': {event: True for event in ('created', 'updated', 'deleted', 'scored', 'checklistScored')}
+        }
+    
+    def register_webhook(self, url: str, label: str) -> Dict:
+        """Register a taskActivity webhook, or point the existing one with the same label at url"""
+        body = self._webhook_body(url, label)
+        existing = next((hook for hook in self.get_webhooks() if hook.get('label') == label), None)
+        if existing is not None:
+            logger.info(f"Updating webhook {existing['id']}")
+            return self._make_request(f"user/webhook/{existing['id']}", method='PUT', data=body)
+        logger.info(f"Registering webhook for {label}")
+        return self._make_request('user/webhook', method='POST', data=body)
+    
+    def delete_webhook(self, label: str) -> bool:
+        """Delete the webhook with the given label; returns False if there was none"""
+        existing = next((hook for hook in self.get_webhooks() if hook.get('label') == label), None)
+        if existing is None:
+            return False
+        self._make_request(f"user/webhook/{existing['id']}", method='DELETE')
+        return True
+    
     def get_user_stats(self) -> Dict:
         """Get user stats from Habitica (optional feature)"""
-        return self._make_request('user')
+        return self._cached_request('user')
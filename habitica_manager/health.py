@@ -0,0 +1,146 @@
+"""
+Cached health state for the /health and /api endpoints.
+
+Load balancers and monitoring poll these endpoints constantly, so they must not
+touch the database or Habitica. A background thread in each worker checks the
+database, the age of the task snapshot and Habitica, and the endpoints only
+read the result. Until the first snapshot exists the local checks run on every
+call instead, so readiness is reported as soon as the first sync completes.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from . import task_store
+from .database import get_connection
+
+logger = logging.getLogger(__name__)
+
+class HealthMonitor:
+    """Keeps liveness and readiness state up to date in the background"""
+
+    def __init__(self, service):
+        self.service = service
+        # Seconds between database and snapshot checks
+        self.interval = float(os.getenv('HEALTH_CHECK_INTERVAL', '15'))
+        # Habitica is probed only when no request has reached it for this long (seconds)
+        self.upstream_interval = float(os.getenv('HEALTH_UPSTREAM_INTERVAL', '300'))
+        # A snapshot older than this marks the service as degraded (seconds)
+        self.max_sync_age = float(os.getenv('HEALTH_MAX_SYNC_AGE', '900'))
+
+        self._database: Optional[Dict] = None
+        self._sync: Optional[Dict] = None
+        self._probe: Optional[Dict] = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the monitor thread in this process if it is not running"""
+        # Threads do not survive a fork, so a preloaded app needs one per worker
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._pid = pid
+            self._thread.start()
+            logger.info(f"Health monitor started in process {pid} (interval: {self.interval}s)")
+
+    def check_local(self):
+        """Check the database and the task snapshot"""
+        start = time.perf_counter()
+        try:
+            get_connection().execute('SELECT 1').fetchone()
+            last_sync = task_store.get_last_sync()
+            self._database = {
+                'ok': True,
+                'latency_ms': round((time.perf_counter() - start) * 1000, 2),
+                'error': None,
+                'checked_at': time.time()
+            }
+            self._sync = {
+                'synced_at': last_sync['sync_time'] if last_sync else None,
+                'age': last_sync['age'] if last_sync else None,
+                'has_tasks': last_sync is not None or task_store.has_tasks(),
+                'checked_at': time.time()
+            }
+        except Exception as e:
+            logger.error(f"Database health check failed: {e}")
+            self._database = {'ok': False, 'latency_ms': None, 'error': str(e), 'checked_at': time.time()}
+
+    def check_upstream(self):
+        """Probe Habitica unless a recent request already showed how it is doing"""
+        last = self.service.last_upstream
+        if last is not None and time.time() - last['checked_at'] < self.upstream_interval:
+            return
+
+        # test_connection requests a handful of user fields, not the full user document
+        result = self.service.test_connection()
+        if not result['success']:
+            self._probe = {'ok': False, 'error': result['message'], 'checked_at': time.time()}
+
+    def _run(self):
+        """Monitor loop"""
+        next_upstream = 0.0
+        while True:
+            try:
+                self.check_local()
+                if time.time() >= next_upstream:
+                    self.check_upstream()
+                    next_upstream = time.time() + self.upstream_interval
+            except Exception as e:
+                logger.error(f"Health monitor error: {e}")
+
+            time.sleep(self.interval)
+
+    def _upstream(self) -> Dict:
+        """Most recent upstream outcome, from real traffic or the monitor's own probe"""
+        candidates = [state for state in (self.service.last_upstream, self._probe) if state is not None]
+        if not candidates:
+            return {'ok': None, 'status_code': None, 'latency_ms': None, 'error': None, 'age': None}
+        latest = dict(max(candidates, key=lambda state: state['checked_at']))
+        latest['age'] = round(time.time() - latest.pop('checked_at'), 1)
+        return latest
+
+    def status(self) -> Dict:
+        """Current health from the cached checks; does no I/O once a snapshot has been seen"""
+        if self._sync is None or not self._sync['has_tasks']:
+            self.check_local()
+
+        now = time.time()
+        database = dict(self._database)
+        database['age'] = round(now - database.pop('checked_at'), 1)
+
+        sync = {'synced_at': None, 'age': None}
+        has_tasks = False
+        if self._sync is not None:
+            has_tasks = self._sync['has_tasks']
+            sync['synced_at'] = self._sync['synced_at']
+            if self._sync['age'] is not None:
+                sync['age'] = round(self._sync['age'] + now - self._sync['checked_at'], 1)
+
+        upstream = self._upstream()
+
+        # Ready to serve once the database works and there is a snapshot to serve from
+        ready = database['ok'] and has_tasks
+        if not database['ok']:
+            state = 'unhealthy'
+        elif upstream['ok'] is False or sync['age'] is None or sync['age'] > self.max_sync_age:
+            state = 'degraded'
+        else:
+            state = 'healthy'
+
+        return {
+            'status': state,
+            'ready': ready,
+            'database': database,
+            'sync': sync,
+            'upstream': upstream
+        }
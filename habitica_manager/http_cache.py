@@ -0,0 +1,126 @@
+"""
+Conditional GETs and compression for the app's JSON responses and pages.
+
+Task lists get an ETag derived from the data version and the release (a hash
+of the app's code and templates, so a deploy invalidates them), checked before
+anything is read from the task store; other JSON responses and the HTML pages get one
+hashed from their body. Either way a matching If-None-Match is answered with
+304 Not Modified. JSON, NDJSON and HTML bodies are compressed with brotli or
+gzip, whichever the client prefers. Streamed bodies are compressed chunk by chunk, so they are
+still delivered as they are produced. ETags name the content coding, as the
+compressed and uncompressed bodies differ.
+"""
+
+import hashlib
+import logging
+import os
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import brotli
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+EXTENSION_KEY = 'habitica_manager_release'
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/html')
+
+# Bodies smaller than this (bytes) aren't worth compressing; streamed bodies always are
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+
+# Cheap settings suited to compressing each response as it is sent
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+def negotiate_encoding() -> Optional[str]:
+    """Content coding to compress the current response with: 'br', 'gzip' or None"""
+    return request.accept_encodings.best_match(('br', 'gzip'))
+
+def _tag(digest_input: bytes, coding: Optional[str]) -> str:
+    digest = hashlib.sha256(digest_input).hexdigest()[:32]
+    return f'{digest}-{coding}' if coding else digest
+
+def release_hash(package_dir: str) -> str:
+    """Hash of the Python modules and templates under package_dir"""
+    package = Path(package_dir)
+    digest = hashlib.sha256()
+    for path in sorted(package.rglob('*')):
+        if path.suffix in ('.py', '.html') and path.is_file():
+            digest.update(path.relative_to(package).as_posix().encode('utf-8'))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+def version_etag(*parts) -> str:
+    """ETag for a response determined by parts (data version, account, ...), the release and the request URL"""
+    key = ':'.join(str(part) for part in (current_app.extensions[EXTENSION_KEY],) + parts) + ':' + request.full_path
+    return _tag(key.encode('utf-8'), negotiate_encoding())
+
+def is_not_modified(etag: str) -> bool:
+    """Whether the client already holds the representation with this ETag"""
+    return request.method in ('GET', 'HEAD') and request.if_none_match.contains_weak(etag)
+
+def _compress(body: bytes, coding: str) -> bytes:
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return zlib.compress(body, GZIP_LEVEL, wbits=31)
+
+def _compress_stream(chunks: Iterable, coding: str) -> Iterator[bytes]:
+    """Compress a streamed body, flushing after each chunk so that none is held back"""
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compress(chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def _after_request(response):
+    if response.mimetype not in COMPRESSIBLE_TYPES or response.status_code not in (200, 304):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if request.method in ('GET', 'HEAD'):
+        # Cached copies are kept but revalidated on every use
+        response.cache_control.no_cache = True
+        response.cache_control.private = True
+    if response.status_code == 304:
+        return response
+
+    coding = None if 'Content-Encoding' in response.headers else negotiate_encoding()
+
+    if not response.is_streamed:
+        if (response.content_length or 0) < COMPRESS_MIN_SIZE:
+            coding = None
+        if request.method in ('GET', 'HEAD') and response.get_etag()[0] is None:
+            response.set_etag(_tag(response.get_data(), coding))
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+        if coding:
+            response.set_data(_compress(response.get_data(), coding))
+            response.headers['Content-Encoding'] = coding
+        return response
+
+    if coding:
+        response.response = _compress_stream(response.response, coding)
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = coding
+    return response
+
+def init_app(app):
+    """Register the conditional GET and compression hook"""
+    # Computed once per process; a deploy restarts the workers
+    app.extensions[EXTENSION_KEY] = release_hash(app.root_path)
+    app.after_request(_after_request)
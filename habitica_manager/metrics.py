@@ -0,0 +1,147 @@
+"""
+Prometheus metrics for routes, Habitica calls, the response cache and SQLite.
+
+Under gunicorn each worker is a separate process, so counters and histograms
+are written to files in PROMETHEUS_MULTIPROC_DIR (set up in gunicorn.conf.py)
+and summed across workers when /metrics is scraped. Values that live in the
+database (rate limit budget, sync history) are read at scrape time instead.
+"""
+
+import functools
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Tuple
+
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily, SummaryMetricFamily
+
+from .profiling import phase
+
+logger = logging.getLogger(__name__)
+
+# Route and upstream latencies (seconds); Habitica calls are rarely under 50ms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQLite statements are mostly well under a millisecond
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+HTTP_REQUESTS = Counter('hbm_http_requests_total', 'Requests handled, by route and status',
+                        ['method', 'endpoint', 'status'])
+HTTP_LATENCY = Histogram('hbm_http_request_duration_seconds', 'Time to produce a response, by route',
+                         ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+
+UPSTREAM_REQUESTS = Counter('hbm_habitica_requests_total', 'Requests sent to Habitica, by endpoint and status',
+                            ['method', 'endpoint', 'status'])
+UPSTREAM_LATENCY = Histogram('hbm_habitica_request_duration_seconds', 'Habitica response time, by endpoint',
+                             ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+
+CACHE_LOOKUPS = Counter('hbm_cache_lookups_total', 'Response cache lookups, by result (hit or miss)',
+                        ['result'])
+CACHE_REVALIDATIONS = Counter('hbm_cache_revalidations_total',
+                              'Conditional requests for stale cache entries, by result (not_modified or modified)',
+                              ['result'])
+
+DB_QUERY_LATENCY = Histogram('hbm_db_query_duration_seconds', 'Time spent in SQLite, by operation',
+                             ['operation'], buckets=QUERY_BUCKETS)
+
+# Habitica task and tag IDs in endpoint paths, replaced to keep label cardinality bounded
+_ID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+def upstream_endpoint(endpoint: str) -> str:
+    """Label for a Habitica endpoint: query string dropped and IDs replaced"""
+    return _ID_PATTERN.sub('{id}', endpoint.split('?', 1)[0])
+
+def observe_upstream(method: str, endpoint: str, status, seconds=None):
+    """Record a Habitica call; status is the HTTP status or 'error' for network failures"""
+    label = upstream_endpoint(endpoint)
+    UPSTREAM_REQUESTS.labels(method, label, str(status)).inc()
+    if seconds is not None:
+        UPSTREAM_LATENCY.labels(method, label).observe(seconds)
+
+@contextmanager
+def time_query(operation: str):
+    """Time a block of SQLite work"""
+    start = time.perf_counter()
+    try:
+        with phase('db'):
+            yield
+    finally:
+        DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+def timed_query(func: Callable) -> Callable:
+    """Decorator timing a database function, labelled with its name"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with time_query(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+class StoreCollector:
+    """Metrics read from the database when scraped, so they are the same in every worker"""
+
+    def __init__(self, rate_limiter):
+        self.rate_limiter = rate_limiter
+
+    def collect(self):
+        # Imported here because task_store itself imports this module
+        from . import task_store
+
+        budget = self.rate_limiter.status()
+        tokens = GaugeMetricFamily('hbm_rate_limit_tokens', 'Requests left in the local token bucket')
+        tokens.add_metric([], budget['tokens'])
+        yield tokens
+        if budget['remaining'] is not None:
+            remaining = GaugeMetricFamily('hbm_rate_limit_remaining',
+                                          'Requests left in the window, as last reported by Habitica')
+            remaining.add_metric([], budget['remaining'])
+            yield remaining
+
+        durations = SummaryMetricFamily('hbm_sync_duration_seconds', 'Task sync durations from sync_log, by status',
+                                        labels=['status'])
+        for status, count, total_ms in task_store.get_sync_stats():
+            durations.add_metric([status], count, (total_ms or 0) / 1000)
+        yield durations
+
+        last_sync = task_store.get_last_sync()
+        if last_sync is not None:
+            age = GaugeMetricFamily('hbm_last_sync_age_seconds', 'Age of the task snapshot')
+            age.add_metric([], last_sync['age'])
+            yield age
+            if last_sync['duration_ms'] is not None:
+                last_duration = GaugeMetricFamily('hbm_last_sync_duration_seconds',
+                                                  'Duration of the last successful sync')
+                last_duration.add_metric([], last_sync['duration_ms'] / 1000)
+                yield last_duration
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        # The route pattern, not the path, so IDs in URLs don't create new series
+        endpoint = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        HTTP_REQUESTS.labels(request.method, endpoint, str(response.status_code)).inc()
+        HTTP_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - start)
+    return response
+
+def init_app(app):
+    """Record request counts and latencies for every route"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+def render(store_collector: StoreCollector) -> Tuple[bytes, str]:
+    """Render all metrics in the Prometheus text format"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    store_registry = CollectorRegistry(auto_describe=False)
+    store_registry.register(store_collector)
+    return generate_latest(registry) + generate_latest(store_registry), CONTENT_TYPE_LATEST
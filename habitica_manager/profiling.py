@@ -0,0 +1,171 @@
+"""
+Opt-in request profiling.
+
+With PROFILING=on every request is profiled; with PROFILING=header only
+requests sent with an `X-Profile: 1` header are. A profiled request gets a
+Server-Timing header breaking its time down by phase (Habitica calls, rate
+limit waits, SQLite, JSON encoding, template rendering), and when it takes
+longer than PROFILING_SLOW_MS its cProfile output is written to PROFILING_DIR.
+Streamed responses are profiled until their body has been sent, but their
+Server-Timing header is written first and only covers the setup.
+
+With PROFILING=off (the default) no hooks are registered and phase() returns
+immediately.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+from .jsonutil import OrjsonJSONProvider
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+# Set by init_app when profiling is configured
+_enabled = False
+
+def _timings():
+    """Phase timings of the current request, or None if it isn't being profiled"""
+    if not _enabled or not has_request_context():
+        return None
+    return g.get('profile_timings')
+
+@contextmanager
+def phase(name: str):
+    """Add the time spent in a block to a phase of the current request's profile.
+
+    Nested blocks of the same phase are only counted once.
+    """
+    timings = _timings()
+    if timings is None or name in g.profile_active:
+        yield
+        return
+
+    g.profile_active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        g.profile_active.discard(name)
+
+class ProfilingJSONProvider(OrjsonJSONProvider):
+    """JSON provider that times encoding as the 'json' phase"""
+
+    def dumps(self, obj, **kwargs):
+        with phase('json'):
+            return super().dumps(obj, **kwargs)
+
+def _start_template(sender, template, context, **extra):
+    if _timings() is not None:
+        g.profile_template_start = time.perf_counter()
+
+def _end_template(sender, template, context, **extra):
+    timings = _timings()
+    start = g.pop('profile_template_start', None)
+    if timings is not None and start is not None:
+        timings['render'] = timings.get('render', 0.0) + time.perf_counter() - start
+
+class RequestProfiler:
+    """Hooks that profile requests and report or dump the results"""
+
+    def __init__(self, mode: str, slow_ms: float, profile_dir: Path):
+        self.mode = mode
+        self.slow_ms = slow_ms
+        self.profile_dir = profile_dir
+
+    def before_request(self):
+        if self.mode != 'on' and request.headers.get(PROFILE_HEADER) != '1':
+            return
+        g.profile_timings = {}
+        g.profile_active = set()
+        g.profile_start = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    def after_request(self, response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        timings, start = g.profile_timings, g.profile_start
+        method, path = request.method, request.path
+        if response.mimetype == 'text/event-stream':
+            # Event streams stay open by design, so there is nothing to learn from their duration
+            profiler.disable()
+            return response
+
+        # A streamed body is produced after this hook, so its header only covers the setup;
+        # the logged timings and the dumped profile cover the whole response
+        response.headers['Server-Timing'] = self._server_timing(timings, start)
+        if response.is_streamed:
+            response.call_on_close(lambda: self._finish(profiler, timings, start, method, path))
+        else:
+            self._finish(profiler, timings, start, method, path)
+        return response
+
+    @staticmethod
+    def _server_timing(timings: dict, start: float) -> str:
+        total_ms = (time.perf_counter() - start) * 1000
+        metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(timings.items())]
+        metrics.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(metrics)
+
+    def _finish(self, profiler: cProfile.Profile, timings: dict, start: float, method: str, path: str):
+        """Stop profiling a request once its response is complete, dumping the profile if it was slow"""
+        profiler.disable()
+        total_ms = (time.perf_counter() - start) * 1000
+        if total_ms >= self.slow_ms:
+            self._dump(profiler, self._server_timing(timings, start), total_ms, method, path)
+
+    def _dump(self, profiler: cProfile.Profile, phases: str, total_ms: float, method: str, path: str):
+        """Write the profile in binary (for snakeviz/pstats) and text form"""
+        try:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_') or 'root'
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{total_ms:.0f}ms"
+            profiler.dump_stats(str(self.profile_dir / f'{name}.prof'))
+
+            report = io.StringIO()
+            report.write(f'{method} {path}: {phases}\n\n')
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(50)
+            (self.profile_dir / f'{name}.txt').write_text(report.getvalue())
+            logger.warning(f"Slow request {method} {path} took {total_ms:.0f}ms ({phases}), "
+                           f"profile written to {self.profile_dir / name}.prof")
+        except OSError as e:
+            logger.error(f"Could not write request profile: {e}")
+
+def init_app(app):
+    """Register the profiling hooks if PROFILING is 'on' or 'header'"""
+    global _enabled
+
+    mode = os.getenv('PROFILING', 'off').lower()
+    if mode not in ('on', 'header'):
+        return
+
+    project_root = Path(__file__).parent.parent
+    profiler = RequestProfiler(
+        mode=mode,
+        # Requests slower than this (ms) get their cProfile output written out
+        slow_ms=float(os.getenv('PROFILING_SLOW_MS', '500')),
+        profile_dir=Path(os.getenv('PROFILING_DIR', str(project_root / 'data' / 'profiles')))
+    )
+
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.json = ProfilingJSONProvider(app)
+    before_render_template.connect(_start_template, app)
+    template_rendered.connect(_end_template, app)
+
+    _enabled = True
+    logger.info(f"Request profiling enabled ({mode}), slow threshold {profiler.slow_ms:.0f}ms")
@@ -0,0 +1,146 @@
+"""
+Rate limiting for outbound Habitica API calls.
+
+Habitica allows about 30 requests per minute per user and reports the budget
+left in the X-RateLimit-Remaining and X-RateLimit-Reset headers. The token
+bucket lives in the SQLite database so every gunicorn worker draws from the
+same budget.
+"""
+
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+from .database import get_connection, transaction
+from .metrics import time_query
+
+logger = logging.getLogger(__name__)
+
+class RateLimitTimeout(Exception):
+    """Raised when no request slot became available in time"""
+    pass
+
+def parse_reset(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Parse an X-RateLimit-Reset or Retry-After value into an epoch timestamp"""
+    if not value:
+        return None
+    now = now if now is not None else time.time()
+
+    try:
+        number = float(value)
+        if number > 1e12:   # Epoch milliseconds
+            return number / 1000
+        if number > 1e9:    # Epoch seconds
+            return number
+        return now + number  # Seconds from now
+    except ValueError:
+        pass
+
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        pass
+
+    # Habitica sends JavaScript Date strings, e.g.
+    # "Mon Jan 06 2025 12:00:00 GMT+0000 (Coordinated Universal Time)"
+    try:
+        return datetime.strptime(value.split(' (')[0], '%a %b %d %Y %H:%M:%S GMT%z').timestamp()
+    except ValueError:
+        logger.debug(f"Could not parse rate limit reset value: {value}")
+        return None
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class RateLimiter:
+    """Token bucket shared across workers, corrected by Habitica's rate limit headers"""
+
+    def __init__(self, name: str, requests_per_minute: Optional[float] = None,
+                 max_wait: Optional[float] = None):
+        self.name = name
+        self.capacity = float(requests_per_minute or os.getenv('HABITICA_RATE_LIMIT', '30'))
+        self.refill_rate = self.capacity / 60.0
+        # Longest a caller is queued before giving up (seconds)
+        self.max_wait = float(max_wait if max_wait is not None else os.getenv('HABITICA_RATE_LIMIT_MAX_WAIT', '90'))
+
+    def _reserve(self) -> float:
+        """Take a token if one is available; otherwise return how long to wait for one"""
+        now = time.time()
+        # An immediate transaction takes the write lock up front so workers can't both take the last token
+        with time_query('rate_limit_reserve'), transaction() as conn:
+            row = conn.execute(
+                'SELECT tokens, updated_at, remaining, reset_at FROM rate_limit WHERE name = ?', (self.name,)
+            ).fetchone()
+            if row is None:
+                tokens, updated_at, remaining, reset_at = self.capacity, now, None, None
+            else:
+                tokens, updated_at, remaining, reset_at = row
+
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+
+            # The server's view wins: with no budget left, wait for the window to reset
+            if reset_at is not None and reset_at <= now:
+                remaining, reset_at = None, None
+            if remaining is not None and remaining <= 0 and reset_at is not None:
+                return reset_at - now
+
+            if tokens < 1:
+                return (1 - tokens) / self.refill_rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limit (name, tokens, updated_at, remaining, reset_at) VALUES (?, ?, ?, ?, ?)',
+                (self.name, tokens - 1, now, remaining - 1 if remaining is not None else None, reset_at)
+            )
+            return 0
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        deadline = time.time() + self.max_wait
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+
+            if time.time() + wait > deadline:
+                raise RateLimitTimeout(f"No Habitica request slot available within {self.max_wait:.0f}s")
+
+            logger.info(f"Rate limit reached, waiting {wait:.1f}s before the next Habitica request")
+            time.sleep(wait)
+
+    def update(self, headers: Mapping[str, str], status_code: int):
+        """Record the budget reported by Habitica in the response headers"""
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_at = parse_reset(headers.get('X-RateLimit-Reset'))
+
+        if status_code == 429:
+            remaining = 0
+            reset_at = parse_reset(headers.get('Retry-After')) or reset_at or time.time() + 60
+
+        if remaining is None:
+            return
+
+        try:
+            remaining = int(remaining)
+        except ValueError:
+            return
+
+        now = time.time()
+        with transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO rate_limit (name, tokens, updated_at) VALUES (?, ?, ?)',
+                         (self.name, self.capacity, now))
+            conn.execute('UPDATE rate_limit SET remaining = ?, reset_at = ? WHERE name = ?',
+                         (remaining, reset_at, self.name))
+
+    def status(self) -> Dict:
+        """Get the current budget, as last reported by Habitica"""
+        row = get_connection().execute('SELECT tokens, remaining, reset_at FROM rate_limit WHERE name = ?',
+                                       (self.name,)).fetchone()
+
+        if row is None:
+            return {'tokens': self.capacity, 'remaining': None, 'reset_at': None}
+        return {'tokens': row[0], 'remaining': row[1], 'reset_at': row[2]}
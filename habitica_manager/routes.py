@@ -1,7 +1,19 @@
-from flask import Blueprint, jsonify, request, render_template
+from flask import (Blueprint, Response, current_app, jsonify, redirect, request, render_template, session,
+                   stream_with_context, url_for)
+import hashlib
+import hmac
 import logging
-from .habitica_service import HabiticaService, HabiticaAPIError
-from .database import test_connection
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from .errors import HabiticaAPIError
+from .jsonutil import dumps
+from .accounts import (AccessDenied, AccountNotFound, access_key_hash, check_access_key, default_account_open,
+                       list_accounts)
+from .database import DEFAULT_ACCOUNT, test_connection
+from .services import get_services
+from . import assets, fragments, http_cache, metrics, task_store, webhooks
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
@@ -9,13 +21,255 @@ logger = logging.getLogger(__name__)
 # Create blueprint
 main_bp = Blueprint('main', __name__)
 
-# Initialize Habitica service
-habitica_service = HabiticaService()
+# Upper bound on the todos created by one bulk clone request
+MAX_BULK_CLONE = 500
+
+# Largest page of tasks a list endpoint returns
+MAX_PAGE_SIZE = 500
+
+# Query parameters accepted by the task list endpoints
+TASK_QUERY_PARAMS = ('type', 'completed', 'tag', 'due_from', 'due_to', 'q', 'sort', 'limit', 'cursor')
+
+# Tasks encoded into each chunk of a streamed task list
+STREAM_CHUNK_TASKS = 500
+
+# Live update stream: seconds between checks for new task changes, between keep-alive
+# comments (and snapshot freshness checks), and before the browser is asked to reconnect
+SSE_POLL_INTERVAL = float(os.getenv('SSE_POLL_INTERVAL', '1'))
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+SSE_MAX_DURATION = float(os.getenv('SSE_MAX_DURATION', '60'))
+# Streams each process holds open at once; keep it below gunicorn's THREADS so that other
+# requests still get a thread. Clients turned away poll /api/tasks/changes instead.
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '4'))
+
+# Event streams open in this process
+_open_streams = 0
+_streams_lock = threading.Lock()
+
+# Names the account a request acts for; the account= query parameter works too
+ACCOUNT_HEADER = 'X-Habitica-Account'
+
+# Session key holding the accounts the browser has signed in to
+SESSION_ACCOUNTS = 'accounts'
+
+def _session_fingerprint(account_id):
+    """Ties a sign-in to the account's current access key, so that a new key signs everyone out"""
+    key_hash = access_key_hash(account_id)
+    if key_hash is None:
+        return None
+    # Keyed, as session cookies are signed but readable
+    return hmac.new(current_app.config['SECRET_KEY'].encode('utf-8'), f'{account_id}:{key_hash}'.encode('utf-8'),
+                    hashlib.sha256).hexdigest()
+
+def _may_use(account_id) -> bool:
+    """Whether the request has signed in to an account or carries its access key as a bearer token"""
+    if account_id == DEFAULT_ACCOUNT and default_account_open():
+        return True
+    signed_in = session.get(SESSION_ACCOUNTS, {}).get(account_id)
+    if signed_in is not None and hmac.compare_digest(signed_in, _session_fingerprint(account_id) or ''):
+        return True
+    auth = request.authorization
+    return auth is not None and auth.type == 'bearer' and check_access_key(account_id, auth.token)
+
+def _account():
+    """Services of the account the request is for; raises AccessDenied or AccountNotFound"""
+    account_id = request.headers.get(ACCOUNT_HEADER) or request.args.get('account') or DEFAULT_ACCOUNT
+    # Unknown accounts are denied too, so that callers can't probe which IDs exist
+    if not _may_use(account_id):
+        raise AccessDenied(account_id)
+    return get_services().account(account_id)
+
+def _acquire_stream() -> bool:
+    """Take one of this process's event stream slots, if one is free"""
+    global _open_streams
+    # A worker without threads would be blocked for as long as the stream is open
+    if not request.environ.get('wsgi.multithread'):
+        return False
+    with _streams_lock:
+        if _open_streams >= SSE_MAX_STREAMS:
+            return False
+        _open_streams += 1
+        return True
+
+def _release_stream():
+    global _open_streams
+    with _streams_lock:
+        _open_streams -= 1
+
+def _parse_due_date(value, end=False):
+    """Parse a due date filter; a plain date used as an upper bound includes that whole day"""
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            return (day + timedelta(days=1)).isoformat() if end else day.isoformat()
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return value
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}'. Use YYYY-MM-DD or an ISO 8601 timestamp")
+
+def _parse_fields():
+    """Parse the fields= projection: None for the compact list representation,
+    ['all'] for full tasks, or a list of top-level task fields"""
+    value = request.args.get('fields')
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    if 'all' in fields:
+        return ['all']
+    # The ID is needed to act on a task, so it is always included
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+def _wants_ndjson():
+    """Whether the task list is requested as newline-delimited JSON (format=ndjson); raises ValueError"""
+    value = request.args.get('format', 'json')
+    if value not in ('json', 'ndjson'):
+        raise ValueError("format must be json or ndjson")
+    return value == 'ndjson'
+
+def _json_array(tasks):
+    """Join encoded tasks into a JSON array, yielded in chunks"""
+    chunk, separator = ['['], ''
+    for task in tasks:
+        chunk.append(separator)
+        chunk.append(task)
+        separator = ','
+        if len(chunk) >= 2 * STREAM_CHUNK_TASKS:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append(']')
+    yield ''.join(chunk)
+
+def _ndjson_lines(tasks):
+    """Join encoded tasks into newline-delimited JSON, yielded in chunks"""
+    chunk = []
+    for task in tasks:
+        chunk.append(task)
+        if len(chunk) >= STREAM_CHUNK_TASKS:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+def _task_stream(account, task_type=None):
+    """TaskStream for a task list request's query string; raises ValueError"""
+    query = _parse_task_query(task_type)
+    if _wants_ndjson() and ('limit' in query or 'cursor' in query):
+        raise ValueError("format=ndjson returns every matching task; limit and cursor can't be used with it")
+    return task_store.TaskStream(account_id=account.id, **query)
+
+def _stream_tasks(account, meta, data):
+    """Stream a task list response without holding the whole list in memory.
+    
+    data is a TaskStream, or a dict of them for tasks grouped by type. The body
+    is meta with data (and next_cursor for a single stream) added; with
+    format=ndjson it is one task per line instead, and the version is sent in
+    the X-Tasks-Version header.
+    
+    The ETag is derived from the data version, so a client holding the current
+    tasks gets a 304 without any task being read.
+    """
+    etag = http_cache.version_etag(account.id, meta['version'])
+    if http_cache.is_not_modified(etag):
+        response = Response(status=304, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+    
+    if _wants_ndjson():
+        response = Response(stream_with_context(_ndjson_lines(data)), mimetype='application/x-ndjson',
+                            headers={'X-Tasks-Version': str(meta['version'])})
+        response.set_etag(etag)
+        return response
+    
+    def generate():
+        # The envelope is written around the streamed array(s)
+        yield dumps(meta)[:-1] + ',"data":'
+        if isinstance(data, dict):
+            separator = '{'
+            for key, stream in data.items():
+                yield f'{separator}{dumps(key)}:'
+                yield from _json_array(stream)
+                separator = ','
+            yield '}}'
+        else:
+            yield from _json_array(data)
+            yield f',"next_cursor":{dumps(data.next_cursor)}}}'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+def _parse_task_query(task_type=None):
+    """Build task_store.query_tasks arguments from the query string; raises ValueError"""
+    args = request.args
+    query = {}
+    
+    if task_type:
+        query['types'] = [task_type]
+    elif args.get('type'):
+        types = [t.strip() for t in args['type'].split(',') if t.strip()]
+        invalid = [t for t in types if t not in ('todo', 'habit', 'daily', 'reward')]
+        if invalid:
+            raise ValueError(f"Invalid task type '{invalid[0]}'. Expected todo, habit, daily or reward")
+        query['types'] = types
+    
+    if 'completed' in args:
+        value = args['completed'].lower()
+        if value not in ('true', 'false'):
+            raise ValueError("completed must be true or false")
+        query['completed'] = value == 'true'
+    
+    if args.get('tag'):
+        query['tag'] = args['tag']
+    if args.get('due_from'):
+        query['due_from'] = _parse_due_date(args['due_from'])
+    if args.get('due_to'):
+        query['due_to'] = _parse_due_date(args['due_to'], end=True)
+    if args.get('q'):
+        query['search'] = args['q']
+    
+    # A leading '-' sorts descending, e.g. sort=-due_date
+    sort = args.get('sort', 'position')
+    query['descending'] = sort.startswith('-')
+    query['sort'] = sort.lstrip('-')
+    
+    if 'limit' in args:
+        try:
+            limit = int(args['limit'])
+        except ValueError:
+            raise ValueError("limit must be a number")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        query['limit'] = limit
+    if args.get('cursor'):
+        query['cursor'] = args['cursor']
+    
+    query['fields'] = _parse_fields()
+    return query
 
 @main_bp.route('/', methods=['GET'])
 def home():
-    """Serve the main HTML page"""
-    return render_template('index.html')
+    """Serve the main HTML page with the task lists rendered in"""
+    account = _account()
+    try:
+        account.sync_scheduler.ensure_snapshot()
+    except HabiticaAPIError as e:
+        # The page still works; its Load button retries through the API
+        logger.error(f"Error getting tasks for the home page: {e}")
+        return render_template('index.html', task_lists=None)
+    
+    version = task_store.get_version()
+    # The built asset names are part of the page, so a new build changes the ETag too (as
+    # version_etag covers the templates and code, so does a deploy)
+    etag = http_cache.version_etag(account.id, version, *assets.built_names())
+    if http_cache.is_not_modified(etag):
+        response = Response(status=304, mimetype='text/html')
+    else:
+        response = Response(render_template('index.html', task_lists=fragments.render_task_lists(account.id, version),
+                                            tasks_version=version), mimetype='text/html')
+    response.set_etag(etag)
+    return response
 
 @main_bp.route('/scheduled', methods=['GET'])
 def scheduled():
@@ -27,19 +281,47 @@ def settings():
     """Serve the settings page"""
     return render_template('settings.html')
 
+@main_bp.route('/login', methods=['GET', 'POST'])
+def login():
+    """Sign the browser in to an account with its access key"""
+    account_id = request.values.get('account') or DEFAULT_ACCOUNT
+    if request.method == 'GET':
+        return render_template('login.html', account_id=account_id)
+    
+    # The session cookie is only as safe as the key that signs it
+    if not webhooks.secret_configured(current_app.config['SECRET_KEY']):
+        return render_template('login.html', account_id=account_id,
+                               error='Signing in is disabled until SECRET_KEY is set'), 503
+    if not check_access_key(account_id, request.form.get('access_key')):
+        logger.warning(f"Failed sign-in to account '{account_id}' from {request.remote_addr}")
+        return render_template('login.html', account_id=account_id, error='Wrong account or access key'), 401
+    
+    # Reassigned rather than changed in place so that Flask notices the change
+    session[SESSION_ACCOUNTS] = {**session.get(SESSION_ACCOUNTS, {}), account_id: _session_fingerprint(account_id)}
+    session.permanent = True
+    if account_id == DEFAULT_ACCOUNT:
+        return redirect(url_for('main.home'))
+    return redirect(url_for('main.home', account=account_id))
+
+@main_bp.route('/logout', methods=['POST'])
+def logout():
+    """Sign the browser out of every account"""
+    session.pop(SESSION_ACCOUNTS, None)
+    return redirect(url_for('main.login'))
+
 @main_bp.route('/api', methods=['GET'])
 def api_info():
     """API information endpoint"""
+    account = _account()
     try:
-        creds_info = habitica_service.get_credentials_info()
-        db_info = test_connection()
+        creds_info = account.habitica.get_credentials_info()
         
         return jsonify({
             'status': 'success',
             'message': 'Habitica Manager API is running',
             'version': '1.0.0',
             'habitica_connection': creds_info,
-            'database': db_info
+            'health': get_services().health_monitor.status()
         })
     except Exception as e:
         return jsonify({
@@ -51,9 +333,10 @@ def api_info():
 @main_bp.route('/api/test-connection', methods=['GET'])
 def test_habitica_connection():
     """Test connection to Habitica API"""
+    account = _account()
     try:
         # Use the new test connection method
-        result = habitica_service.test_connection()
+        result = account.habitica.test_connection()
         
         if result['success']:
             user_data = result['user_data']
@@ -82,12 +365,35 @@ def test_habitica_connection():
 
 @main_bp.route('/health', methods=['GET'])
 def health_check():
-    """Health check for load balancers"""
+    """Liveness check for load balancers; always 200 while the process serves requests"""
+    health = get_services().health_monitor.status()
     return jsonify({
-        'status': 'healthy',
+        'status': health['status'],
+        'ready': health['ready'],
         'timestamp': request.headers.get('Date')
     })
 
+@main_bp.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness check: 503 until the database works and a task snapshot exists"""
+    health = get_services().health_monitor.status()
+    return jsonify(health), 200 if health['ready'] else 503
+
+@main_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics, aggregated across gunicorn workers"""
+    body, content_type = metrics.render(get_services().metrics_collector)
+    return Response(body, content_type=content_type)
+
+@main_bp.route('/api/accounts', methods=['GET'])
+def get_accounts():
+    """List the accounts the caller has signed in to or holds the key of"""
+    return jsonify({
+        'status': 'success',
+        'data': [account for account in list_accounts() if _may_use(account['id'])],
+        'message': 'Accounts retrieved successfully'
+    })
+
 @main_bp.route('/api/database', methods=['GET'])
 def database_status():
     """Get database status and information"""
@@ -106,16 +412,152 @@ def database_status():
 
 @main_bp.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    """Get all tasks from Habitica"""
+    """Get all tasks grouped by type, or a filtered page of tasks when query parameters are given.
+    
+    List endpoints return a compact representation of each task; use fields=all
+    (or a list of fields) for more, or /api/tasks/<task_id> for one full task.
+    """
+    account = _account()
     try:
-        tasks = habitica_service.get_tasks()
+        snapshot = account.sync_scheduler.ensure_snapshot()
+        # Read before the tasks, so that changes made meanwhile are fetched again rather than missed
+        version = task_store.get_version()
+        
+        meta = {
+            'status': 'success',
+            'snapshot': snapshot,
+            'version': version,
+            'message': 'Tasks retrieved successfully'
+        }
+        
+        if not any(param in request.args for param in TASK_QUERY_PARAMS) and not _wants_ndjson():
+            fields = _parse_fields()
+            return _stream_tasks(account, meta, {
+                key: task_store.TaskStream(types=[task_type], fields=fields, account_id=account.id)
+                for task_type, key in task_store.TASK_TYPE_KEYS.items()
+            })
+        
+        return _stream_tasks(account, meta, _task_stream(account))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except HabiticaAPIError as e:
+        logger.error(f"Error getting tasks: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@main_bp.route('/api/tasks/changes', methods=['GET'])
+def get_task_changes():
+    """Get the tasks created or modified and the IDs of tasks deleted after version since.
+    
+    Task list responses carry the `version` of the data they return; pass it
+    as since to fetch only what changed. When reset is true the changes since
+    that version are no longer known, and data holds all tasks instead.
+    """
+    account = _account()
+    try:
+        since = int(request.args.get('since', '0'))
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'since must be a version number'
+        }), 400
+    types = [t.strip() for t in request.args.get('type', '').split(',') if t.strip()]
+    invalid = [t for t in types if t not in ('todo', 'habit', 'daily', 'reward')]
+    if invalid:
+        return jsonify({
+            'status': 'error',
+            'message': f"Invalid task type '{invalid[0]}'. Expected todo, habit, daily or reward"
+        }), 400
+    
+    try:
+        snapshot = account.sync_scheduler.ensure_snapshot()
+        changes = task_store.get_changes(since, types=types or None, fields=_parse_fields(), account_id=account.id)
+        return jsonify({
+            'status': 'success',
+            'data': changes['changed'],
+            'deleted': changes['deleted'],
+            'reset': changes['reset'],
+            'version': changes['version'],
+            'snapshot': snapshot,
+            'message': 'Task changes retrieved successfully'
+        })
+    except HabiticaAPIError as e:
+        logger.error(f"Error getting task changes: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@main_bp.route('/api/tasks/<task_id>', methods=['GET'])
+def get_task(task_id):
+    """Get the full details of one task"""
+    task = task_store.get_task(task_id, _account().id)
+    if task is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Task not found'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'data': task,
+        'message': 'Task retrieved successfully'
+    })
+
+@main_bp.route('/api/search', methods=['GET'])
+def search_tasks():
+    """Search the stored tasks' text, notes, checklist items and tag names.
+    
+    q is matched word by word, each word also as the start of a longer one;
+    the best matches come first. type= narrows the task types and limit= the
+    number of results (default 50).
+    """
+    account = _account()
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({
+            'status': 'error',
+            'message': 'q is required'
+        }), 400
+    types = [t.strip() for t in request.args.get('type', '').split(',') if t.strip()]
+    invalid = [t for t in types if t not in ('todo', 'habit', 'daily', 'reward')]
+    if invalid:
+        return jsonify({
+            'status': 'error',
+            'message': f"Invalid task type '{invalid[0]}'. Expected todo, habit, daily or reward"
+        }), 400
+    try:
+        limit = int(request.args.get('limit', task_store.SEARCH_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({
+            'status': 'error',
+            'message': f"limit must be a number between 1 and {MAX_PAGE_SIZE}"
+        }), 400
+    
+    try:
+        snapshot = account.sync_scheduler.ensure_snapshot()
+        tasks = task_store.search_tasks(q, types=types or None, limit=limit, fields=_parse_fields(),
+                                        account_id=account.id)
         return jsonify({
             'status': 'success',
             'data': tasks,
-            'message': 'Tasks retrieved successfully'
+            'snapshot': snapshot,
+            'message': f'Found {len(tasks)} matching tasks'
         })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except HabiticaAPIError as e:
-        logger.error(f"Error getting tasks: {e}")
+        logger.error(f"Error searching tasks: {e}")
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -124,13 +566,21 @@ def get_tasks():
 @main_bp.route('/api/habits', methods=['GET'])
 def get_habits():
     """Get habits from Habitica"""
+    account = _account()
     try:
-        habits = habitica_service.get_habits()
-        return jsonify({
+        snapshot = account.sync_scheduler.ensure_snapshot()
+        version = task_store.get_version()
+        return _stream_tasks(account, {
             'status': 'success',
-            'data': habits,
+            'snapshot': snapshot,
+            'version': version,
             'message': 'Habits retrieved successfully'
-        })
+        }, _task_stream(account, 'habit'))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except HabiticaAPIError as e:
         logger.error(f"Error getting habits: {e}")
         return jsonify({
@@ -141,13 +591,21 @@ def get_habits():
 @main_bp.route('/api/dailies', methods=['GET'])
 def get_dailies():
     """Get daily tasks from Habitica"""
+    account = _account()
     try:
-        dailies = habitica_service.get_dailies()
-        return jsonify({
+        snapshot = account.sync_scheduler.ensure_snapshot()
+        version = task_store.get_version()
+        return _stream_tasks(account, {
             'status': 'success',
-            'data': dailies,
+            'snapshot': snapshot,
+            'version': version,
             'message': 'Dailies retrieved successfully'
-        })
+        }, _task_stream(account, 'daily'))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except HabiticaAPIError as e:
         logger.error(f"Error getting dailies: {e}")
         return jsonify({
@@ -158,13 +616,21 @@ def get_dailies():
 @main_bp.route('/api/todos', methods=['GET'])
 def get_todos():
     """Get todo tasks from Habitica"""
+    account = _account()
     try:
-        todos = habitica_service.get_todos()
-        return jsonify({
+        snapshot = account.sync_scheduler.ensure_snapshot()
+        version = task_store.get_version()
+        return _stream_tasks(account, {
             'status': 'success',
-            'data': todos,
+            'snapshot': snapshot,
+            'version': version,
             'message': 'Todos retrieved successfully'
-        })
+        }, _task_stream(account, 'todo'))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except HabiticaAPIError as e:
         logger.error(f"Error getting todos: {e}")
         return jsonify({
@@ -172,9 +638,28 @@ def get_todos():
             'message': str(e)
         }), 500
 
+@main_bp.route('/api/sync', methods=['POST'])
+def sync_tasks():
+    """Sync tasks from Habitica into the local database"""
+    account = _account()
+    try:
+        result = account.sync_engine.sync()
+        return jsonify({
+            'status': 'success',
+            'data': result,
+            'message': 'Tasks synced successfully'
+        })
+    except HabiticaAPIError as e:
+        logger.error(f"Error syncing tasks: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @main_bp.route('/api/clone_todo', methods=['POST'])
 def clone_todo():
     """Clone a todo task"""
+    account = _account()
     try:
         # Get the todo ID from request
         data = request.get_json()
@@ -188,7 +673,13 @@ def clone_todo():
         logger.info(f"Cloning todo with ID: {todo_id}")
         
         # Clone the todo using the habitica service
-        result = habitica_service.clone_todo(todo_id)
+        result = account.habitica.clone_todo(todo_id)
+        
+        # Store the new todo so it shows up without waiting for the next sync
+        try:
+            task_store.add_task(result, account.id)
+        except Exception as e:
+            logger.warning(f"Cloned todo could not be stored locally: {e}")
         
         return jsonify({
             'status': 'success',
@@ -209,6 +700,190 @@ def clone_todo():
             'error': str(e)
         }), 500
 
+@main_bp.route('/api/clone_todos', methods=['POST'])
+def clone_todos():
+    """Clone several todos, streaming progress as newline-delimited JSON.
+    
+    Body: {"items": [{"todo_id": "...", "copies": 2}, ...]}
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('items'), list) or not data['items']:
+        return jsonify({
+            'status': 'error',
+            'error': 'Missing items in request body'
+        }), 400
+    
+    items = []
+    for item in data['items']:
+        if not isinstance(item, dict) or not isinstance(item.get('todo_id'), str):
+            return jsonify({
+                'status': 'error',
+                'error': 'Each item needs a todo_id'
+            }), 400
+        
+        copies = item.get('copies', 1)
+        # bool is a subclass of int, but true isn't a number of copies
+        if not isinstance(copies, int) or isinstance(copies, bool) or copies < 1:
+            return jsonify({
+                'status': 'error',
+                'error': f"Invalid copies for todo {item['todo_id']}"
+            }), 400
+        items.append((item['todo_id'], copies))
+    
+    total = sum(copies for _, copies in items)
+    if total > MAX_BULK_CLONE:
+        return jsonify({
+            'status': 'error',
+            'error': f'Cannot clone more than {MAX_BULK_CLONE} todos in one request'
+        }), 400
+    
+    logger.info(f"Bulk cloning {total} todos from {len(items)} originals")
+    
+    account = _account()
+    
+    def generate():
+        try:
+            for event in account.habitica.clone_todos(items):
+                if event['event'] == 'created':
+                    # Store each new todo so it shows up without waiting for the next sync
+                    try:
+                        task_store.add_task(event['task'], account.id)
+                    except Exception as e:
+                        logger.warning(f"Cloned todo could not be stored locally: {e}")
+                yield dumps(event) + '\n'
+        except Exception as e:
+            # The response has already started, so report the failure in the stream
+            logger.error(f"Error bulk cloning todos: {e}")
+            yield dumps({'event': 'error', 'message': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@main_bp.route('/api/events', methods=['GET'])
+def task_events():
+    """Stream task changes as Server-Sent Events.
+    
+    Each event is `created`, `updated` or `deleted` with the task ID and, except
+    for deletions, the task's compact representation. The stream ends after
+    SSE_MAX_DURATION seconds; browsers then reconnect and resume after the
+    Last-Event-ID they received. A `reset` event first means changes since
+    then have been pruned, and the client should reload its tasks.
+    
+    Each stream holds a worker thread, so a process serves at most
+    SSE_MAX_STREAMS of them, and none on a worker without threads; other
+    clients get a 503 and poll /api/tasks/changes instead.
+    """
+    account = _account()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if last_event_id:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'Last-Event-ID must be a number'
+            }), 400
+    else:
+        since = task_store.get_last_event_id(account.id)
+    
+    if not _acquire_stream():
+        return jsonify({
+            'status': 'error',
+            'message': 'No event stream available; poll /api/tasks/changes instead'
+        }), 503
+    
+    def generate():
+        last_seq = since
+        yield 'retry: 3000\n\n'
+        if since < task_store.get_event_horizon():
+            # The client reloads everything, so the stream carries on from the current version
+            last_seq = task_store.get_version()
+            yield f"id: {last_seq}\nevent: reset\ndata: {dumps({'version': last_seq})}\n\n"
+        started = last_write = last_check = time.monotonic()
+        while time.monotonic() - started < SSE_MAX_DURATION:
+            now = time.monotonic()
+            if now - last_check >= SSE_HEARTBEAT:
+                # Changes only show up when Habitica is synced, so keep the snapshot fresh while watched
+                last_check = now
+                try:
+                    account.sync_scheduler.ensure_snapshot()
+                except Exception as e:
+                    logger.warning(f"Could not check the task snapshot: {e}")
+            
+            events, last_seq = task_store.get_task_events(last_seq, account_id=account.id)
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {dumps(event)}\n\n"
+            if events:
+                last_write = now
+            elif now - last_write >= SSE_HEARTBEAT:
+                # Keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                last_write = now
+            time.sleep(SSE_POLL_INTERVAL)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if the client left before it started
+    response.call_on_close(_release_stream)
+    return response
+
+@main_bp.route(webhooks.WEBHOOK_PATH, methods=['POST'])
+def habitica_webhook():
+    """Apply a task change pushed by a Habitica taskActivity webhook"""
+    account_id = request.args.get('account', DEFAULT_ACCOUNT)
+    if not webhooks.secret_configured(current_app.config['WEBHOOK_SECRET']):
+        return jsonify({
+            'status': 'error',
+            'message': 'Webhooks are disabled until WEBHOOK_SECRET or SECRET_KEY is set'
+        }), 503
+    if not webhooks.verify_token(current_app.config['WEBHOOK_SECRET'], account_id, request.args.get('token', '')):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid webhook token'
+        }), 403
+    
+    account = get_services().account(account_id)
+    try:
+        result = webhooks.apply_event(request.get_json(silent=True), account.id, account.habitica.user_id)
+    except PermissionError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 403
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    if result['applied']:
+        # Cached task lists predate the change
+        account.habitica.invalidate_cache()
+    return jsonify({
+        'status': 'success',
+        'data': result,
+        'message': 'Webhook processed'
+    })
+
+@main_bp.errorhandler(AccessDenied)
+def access_denied(error):
+    """Send browsers to the sign-in page and tell API clients to authenticate"""
+    if not request.path.startswith('/api/'):
+        return render_template('login.html', account_id=error.account_id), 401
+    response = jsonify({
+        'status': 'error',
+        'message': str(error)
+    })
+    response.headers['WWW-Authenticate'] = 'Bearer'
+    return response, 401
+
+@main_bp.errorhandler(AccountNotFound)
+def account_not_found(error):
+    """Handle requests for accounts that are not configured"""
+    return jsonify({
+        'status': 'error',
+        'message': str(error)
+    }), 404
+
 @main_bp.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
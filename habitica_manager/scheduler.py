@@ -0,0 +1,188 @@
+"""
+Background refresh of the local task snapshot.
+
+Each account has its own scheduler. Every gunicorn worker serving an account
+runs a scheduler thread for it, but only the worker holding the account's
+'scheduler' lease in the sync_lock table syncs on the interval. Any worker can
+run an on-demand refresh; the account's 'sync' lease keeps them from overlapping.
+
+While a webhook is registered for the account, Habitica pushes each change
+(see webhooks.py) and full syncs only run every SYNC_WEBHOOK_INTERVAL seconds,
+to catch deliveries that were missed.
+"""
+
+import logging
+import os
+import socket
+import threading
+from typing import Dict
+
+from . import task_store
+from .database import acquire_lock, release_lock
+
+logger = logging.getLogger(__name__)
+
+class SyncScheduler:
+    """Keeps the task snapshot fresh without blocking read requests"""
+
+    def __init__(self, sync_engine, webhooks_enabled: bool = True):
+        self.sync_engine = sync_engine
+        self.account_id = sync_engine.account_id
+        self.enabled = os.getenv('SYNC_SCHEDULER', 'True').lower() == 'true'
+        # Seconds between scheduled syncs
+        self.interval = float(os.getenv('SYNC_INTERVAL', '300'))
+        # Reads trigger a background refresh when the snapshot is older than this (seconds)
+        self.max_age = float(os.getenv('SYNC_MAX_AGE', '60'))
+        # A sync holding the 'sync' lease longer than this is assumed to have crashed
+        self.sync_timeout = float(os.getenv('SYNC_LOCK_TIMEOUT', '120'))
+        # Seconds to wait after a failed sync before trying again
+        self.retry_delay = float(os.getenv('SYNC_RETRY_DELAY', '30'))
+        # Replaces both the interval and the max age while webhooks keep the snapshot current
+        self.webhook_interval = float(os.getenv('SYNC_WEBHOOK_INTERVAL', '3600'))
+        # Off when deliveries are refused (see webhooks.secret_configured); a registered webhook is then ignored
+        self.webhooks_enabled = webhooks_enabled
+
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # Short-lived refresh thread used when the scheduler thread isn't running
+        self._refresh_thread = None
+        # Set when the account is dropped from the registry; the thread then exits
+        self._stopped = False
+
+    @property
+    def owner(self) -> str:
+        """Lease owner name for this process"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _lease(self, name: str) -> str:
+        """Name of one of this account's leases"""
+        return f"{name}:{self.account_id}"
+
+    def _webhook_registered(self) -> bool:
+        """Check whether a webhook was registered for the account (and not removed since)"""
+        registered = task_store.get_last_sync('webhook', 'registered', self.account_id)
+        if registered is None:
+            return False
+        removed = task_store.get_last_sync('webhook', 'removed', self.account_id)
+        return removed is None or removed['sync_time'] < registered['sync_time']
+
+    def _max_ages(self):
+        """Snapshot ages (seconds) at which reads refresh it, and at which the leader syncs"""
+        if self.webhooks_enabled and self._webhook_registered():
+            return self.webhook_interval, self.webhook_interval
+        return self.max_age, self.interval
+
+    def start(self):
+        """Start the scheduler thread in this process if it is not running"""
+        if not self.enabled or self._stopped:
+            return
+
+        # Threads do not survive a fork, so a preloaded app needs one per worker
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._run, name=f'sync-scheduler-{self.account_id}', daemon=True)
+            self._pid = pid
+            self._thread.start()
+            logger.info(f"Sync scheduler for account '{self.account_id}' started in process {pid} "
+                        f"(interval: {self.interval}s)")
+
+    def stop(self):
+        """Stop the scheduler thread after its current iteration"""
+        self._stopped = True
+        self._wakeup.set()
+
+    def request_refresh(self):
+        """Ask for a refresh without waiting for it"""
+        if not self.enabled or self._stopped:
+            # Without the scheduler thread, refresh on a short-lived thread instead. One at a
+            # time: more would only contend for the 'sync' lease while it runs
+            with self._start_lock:
+                if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                    return
+                self._refresh_thread = threading.Thread(target=self.refresh, name=f'sync-refresh-{self.account_id}',
+                                                        daemon=True)
+                self._refresh_thread.start()
+            return
+        self.start()
+        self._wakeup.set()
+
+    def ensure_snapshot(self) -> Dict:
+        """Return the age of the task snapshot, refreshing it in the background if stale.
+
+        Only the very first load, when nothing has been stored yet, waits for Habitica.
+        """
+        last_sync = task_store.get_last_sync(account_id=self.account_id)
+
+        if last_sync is None and not task_store.has_tasks(self.account_id):
+            logger.info(f"No task snapshot for account '{self.account_id}' yet, syncing before serving")
+            self.sync_engine.sync()
+            last_sync = task_store.get_last_sync(account_id=self.account_id)
+
+        max_age, _ = self._max_ages()
+        stale = last_sync is None or last_sync['age'] >= max_age
+        if stale:
+            self.request_refresh()
+
+        return {
+            'synced_at': last_sync['sync_time'] if last_sync else None,
+            'age': round(last_sync['age'], 1) if last_sync else None,
+            'stale': stale
+        }
+
+    def refresh(self) -> bool:
+        """Sync now unless another worker is already syncing; returns True if a sync ran"""
+        owner = self.owner
+        if not acquire_lock(self._lease('sync'), owner, self.sync_timeout):
+            logger.debug("Sync already running in another worker, skipping refresh")
+            return False
+
+        try:
+            # Another worker may have finished a sync while this request was queued
+            last_sync = task_store.get_last_sync(account_id=self.account_id)
+            if last_sync is not None and last_sync['age'] < min(self._max_ages()):
+                return False
+
+            # Don't hammer Habitica while it is failing
+            last_error = task_store.get_last_sync(status='error', account_id=self.account_id)
+            if last_error is not None and last_error['age'] < self.retry_delay:
+                if last_sync is None or last_error['sync_time'] >= last_sync['sync_time']:
+                    logger.debug("Last sync failed recently, skipping refresh")
+                    return False
+
+            self.sync_engine.sync()
+            return True
+        except Exception as e:
+            logger.error(f"Background sync failed: {e}")
+            return False
+        finally:
+            release_lock(self._lease('sync'), owner)
+
+    def _run(self):
+        """Scheduler loop: sync on the interval when leader, and whenever a refresh is requested"""
+        lease_ttl = self.interval * 2
+        while not self._stopped:
+            try:
+                requested = self._wakeup.is_set()
+                self._wakeup.clear()
+
+                is_leader = acquire_lock(self._lease('scheduler'), self.owner, lease_ttl)
+                last_sync = task_store.get_last_sync(account_id=self.account_id)
+                due = last_sync is None or last_sync['age'] >= self._max_ages()[1]
+
+                if requested or (is_leader and due):
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Sync scheduler error: {e}")
+
+            self._wakeup.wait(timeout=self.interval)
+
+        # Let a worker that still serves the account take over scheduled syncs
+        release_lock(self._lease('scheduler'), self.owner)
@@ -0,0 +1,134 @@
+"""
+Application services, created on first use and bound to the Flask app.
+
+Nothing here talks to Habitica or the database when the app is created; the
+Habitica client, sync engine, scheduler and health monitor are built the first
+time a request (or a gunicorn hook) needs them.
+
+Every account gets its own Habitica client, sync engine and scheduler. The
+default account's are kept for the life of the process; other accounts are
+held in a bounded registry, and the least recently used ones are dropped when
+it is full.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+from flask import current_app
+
+from .database import DEFAULT_ACCOUNT
+
+logger = logging.getLogger(__name__)
+
+EXTENSION_KEY = 'habitica_manager'
+
+class AccountServices:
+    """Habitica client, sync engine and scheduler of one account"""
+
+    def __init__(self, account, webhooks_enabled: bool = True):
+        from .habitica_service import HabiticaService
+        from .scheduler import SyncScheduler
+        from .sync import SyncEngine
+
+        self.id = account.id
+        self.habitica = HabiticaService(account=account)
+        self.sync_engine = SyncEngine(self.habitica)
+        self.sync_scheduler = SyncScheduler(self.sync_engine, webhooks_enabled)
+
+    def stop(self):
+        """Stop background work for an account that is no longer served by this process"""
+        # The HTTP session is left to the garbage collector, since requests
+        # already in progress may still be using it
+        self.sync_scheduler.stop()
+
+class Services:
+    """Lazily constructed services shared by the requests of one app"""
+
+    def __init__(self, webhooks_enabled: bool = True):
+        self._instances: Dict[str, Any] = {}
+        # Reentrant because building one service can build the services it depends on
+        self._lock = threading.RLock()
+        self._accounts: 'OrderedDict[str, AccountServices]' = OrderedDict()
+        # Accounts other than the default kept live in each process
+        self.max_accounts = int(os.getenv('HABITICA_MAX_ACCOUNTS', '32'))
+        # Whether webhook deliveries are accepted, so schedulers may rely on them
+        self.webhooks_enabled = webhooks_enabled
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = factory()
+        return instance
+
+    def account(self, account_id: str = DEFAULT_ACCOUNT) -> AccountServices:
+        """Services of an account; raises accounts.AccountNotFound"""
+        from .accounts import get_account
+
+        if account_id == DEFAULT_ACCOUNT:
+            return self._get('default_account', lambda: AccountServices(get_account(DEFAULT_ACCOUNT),
+                                                                    self.webhooks_enabled))
+
+        with self._lock:
+            services = self._accounts.get(account_id)
+            if services is not None:
+                self._accounts.move_to_end(account_id)
+                return services
+
+            services = self._accounts[account_id] = AccountServices(get_account(account_id),
+                                                                    self.webhooks_enabled)
+            while len(self._accounts) > self.max_accounts:
+                evicted_id, evicted = self._accounts.popitem(last=False)
+                evicted.stop()
+                logger.info(f"Dropped services of account '{evicted_id}' (least recently used)")
+
+        services.sync_scheduler.start()
+        return services
+
+    @property
+    def habitica(self):
+        """Habitica API client of the default account"""
+        return self.account().habitica
+
+    @property
+    def sync_engine(self):
+        """Syncs the default account's Habitica tasks into the local store"""
+        return self.account().sync_engine
+
+    @property
+    def sync_scheduler(self):
+        """Keeps the default account's task snapshot fresh in the background"""
+        return self.account().sync_scheduler
+
+    @property
+    def health_monitor(self):
+        """Cached health state for the probe endpoints"""
+        from .health import HealthMonitor
+        return self._get('health_monitor', lambda: HealthMonitor(self.habitica))
+
+    @property
+    def metrics_collector(self):
+        """Database-backed values reported by /metrics"""
+        from .metrics import StoreCollector
+        return self._get('metrics_collector', lambda: StoreCollector(self.habitica.rate_limiter))
+
+    def start_background(self):
+        """Start this process's scheduler and health monitor threads if they aren't running"""
+        self.sync_scheduler.start()
+        self.health_monitor.start()
+
+def init_app(app) -> Services:
+    """Attach a Services container to the app"""
+    from .webhooks import secret_configured
+    services = Services(webhooks_enabled=secret_configured(app.config.get('WEBHOOK_SECRET')))
+    app.extensions[EXTENSION_KEY] = services
+    return services
+
+def get_services(app=None) -> Services:
+    """Services of the given app, or of the app handling the current request"""
+    return (app or current_app).extensions[EXTENSION_KEY]
@@ -1,6 +1,18 @@
 // Habitica Manager - Main JavaScript File
 // This file currently does simple DOM manipulation and API testing
 
+// Account the page acts for, from its ?account= query parameter (the default account if absent)
+const ACCOUNT_ID = new URLSearchParams(window.location.search).get('account');
+
+// fetch() for the app's API, sending along the account the page acts for
+function apiFetch(url, options = {}) {
+    const headers = Object.assign({}, options.headers);
+    if (ACCOUNT_ID) {
+        headers['X-Habitica-Account'] = ACCOUNT_ID;
+    }
+    return fetch(url, Object.assign({}, options, { headers }));
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Habitica Manager JavaScript loaded successfully!');
     
@@ -43,7 +55,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 output.innerHTML = '<p>Testing API connection...</p>';
                 
                 // Make API call to our Flask backend
-                const response = await fetch('/api');
+                const response = await apiFetch('/api');
                 const data = await response.json();
                 
                 // Display API response
@@ -124,7 +136,7 @@ document.addEventListener('DOMContentLoaded', function() {
             output.innerHTML = '<div class="loading-spinner"></div> Testing Habitica API connection...';
             
             // Test API connection
-            const response = await fetch('/api/test-connection');
+            const response = await apiFetch('/api/test-connection');
             const data = await response.json();
             
             if (data.status === 'success') {
@@ -164,28 +176,30 @@ document.addEventListener('DOMContentLoaded', function() {
             output.classList.add('active');
             output.innerHTML = '<div class="loading-spinner"></div> Loading Habitica data...';
             
-            // Load all data in parallel
-            const [todosResponse, habitsResponse, dailiesResponse] = await Promise.all([
-                fetch('/api/todos'),
-                fetch('/api/habits'),
-                fetch('/api/dailies')
-            ]);
+            // Load all task types with a single combined request
+            const response = await apiFetch('/api/tasks');
+            const tasksData = await response.json();
+            
+            if (tasksData.status !== 'success') {
+                throw new Error(tasksData.message || 'Failed to load tasks');
+            }
             
-            const todosData = await todosResponse.json();
-            const habitsData = await habitsResponse.json();
-            const dailiesData = await dailiesResponse.json();
+            tasksVersion = tasksData.version ?? null;
+            const todos = tasksData.data?.todos || [];
+            const habits = tasksData.data?.habits || [];
+            const dailies = tasksData.data?.dailys || [];
             
             // Display the data
-            displayTodos(todosData.data || []);
-            displayHabits(habitsData.data || []);
-            displayDailies(dailiesData.data || []);
+            displayTodos(todos);
+            displayHabits(habits);
+            displayDailies(dailies);
             
             // Show success message
             output.innerHTML = `
                 <p><strong>Habitica Data Loaded Successfully!</strong></p>
-                <p>Todos: ${todosData.data?.length || 0}</p>
-                <p>Habits: ${habitsData.data?.length || 0}</p>
-                <p>Dailies: ${dailiesData.data?.length || 0}</p>
+                <p>Todos: ${todos.length}</p>
+                <p>Habits: ${habits.length}</p>
+                <p>Dailies: ${dailies.length}</p>
             `;
             
             // Show sections
@@ -193,6 +207,9 @@ document.addEventListener('DOMContentLoaded', function() {
             habitsSection.style.display = 'block';
             dailiesSection.style.display = 'block';
             
+            // Keep the lists current from here on
+            startLiveUpdates();
+            
         } catch (error) {
             console.error('Failed to load Habitica data:', error);
             output.innerHTML = `
@@ -207,23 +224,40 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 3000);
     }
 
-    // Refresh only todos (used after cloning)
-    async function refreshTodos() {
+    // Version of the task data on the page, for fetching only what changed since
+    let tasksVersion = null;
+    
+    // Bring the task lists up to date with what changed since tasksVersion
+    async function refreshTasks() {
         try {
-            console.log('Refreshing todos...');
+            if (tasksVersion === null) {
+                // Nothing to compare against yet, so load everything
+                await loadHabiticaData();
+                return;
+            }
             
-            // Load just the todos
-            const todosResponse = await fetch('/api/todos');
-            const todosData = await todosResponse.json();
+            const changesResponse = await apiFetch(`/api/tasks/changes?type=todo,habit,daily&since=${tasksVersion}`);
+            const changes = await changesResponse.json();
+            if (changes.status !== 'success') {
+                throw new Error(changes.message || 'Failed to load task changes');
+            }
             
-            // Update the todos display
-            displayTodos(todosData.data || []);
+            if (changes.reset) {
+                // The changes are no longer known, so data holds every task
+                displayTodos(changes.data.filter(task => task.type === 'todo'));
+                displayHabits(changes.data.filter(task => task.type === 'habit'));
+                displayDailies(changes.data.filter(task => task.type === 'daily'));
+            } else {
+                changes.data.forEach(task => applyTaskChange('updated', task.id, task));
+                changes.deleted.forEach(taskId => applyTaskChange('deleted', taskId));
+            }
+            tasksVersion = changes.version;
             
-            console.log(`Todos refreshed: ${todosData.data?.length || 0} todos loaded`);
+            console.log(`Tasks refreshed: ${changes.data.length} changed, ${changes.deleted.length} deleted`);
             
         } catch (error) {
-            console.error('Failed to refresh todos:', error);
-            utils.showNotification('Failed to refresh todos', 'error');
+            console.error('Failed to refresh tasks:', error);
+            utils.showNotification('Failed to refresh tasks', 'error');
         }
     }
     
@@ -236,50 +270,53 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        todosList.innerHTML = todos.map(todo => {
-            // Build checklist HTML if it exists
-            let checklistHtml = '';
-            if (todo.checklist && todo.checklist.length > 0) {
-                checklistHtml = `
-                    <div class="checklist">
-                        <h4>Subtasks:</h4>
-                        <ul class="checklist-items">
-                            ${todo.checklist.map(item => `
-                                <li class="checklist-item ${item.completed ? 'completed' : ''}">
-                                    <span class="checklist-checkbox">${item.completed ? '✅' : '☐'}</span>
-                                    <span class="checklist-text">${escapeHtml(item.text)}</span>
-                                </li>
-                            `).join('')}
-                        </ul>
-                        <div class="checklist-progress">
-                            ${todo.checklist.filter(item => item.completed).length} of ${todo.checklist.length} completed
-                        </div>
-                    </div>
-                `;
-            }
-            
-            return `
-                <div class="task-item ${todo.completed ? 'completed' : ''}">
-                    <div class="task-header">
-                        <p class="task-text">${escapeHtml(todo.text)}</p>
-                        <div class="task-actions">
-                            <span class="task-badge badge-todo">Todo</span>
-                            ${todo.completed ? '<span class="task-badge badge-completed">Completed</span>' : ''}
-                            <button class="clone-btn" onclick="cloneTodo('${todo.id}', this)" title="Clone this todo">
-                                Clone
-                            </button>
-                        </div>
-                    </div>
-                    <div class="task-meta">
-                        ${todo.priority ? `<span>Priority: <div class="priority-indicator priority-${getPriorityLevel(todo.priority)}"></div></span>` : ''}
-                        ${todo.date ? `<span>📅 ${formatDate(todo.date)}</span>` : ''}
-                        ${todo.notes ? `<span>📝 Has notes</span>` : ''}
-                        ${todo.checklist && todo.checklist.length > 0 ? `<span>📋 ${todo.checklist.length} subtasks</span>` : ''}
+        todosList.innerHTML = todos.map(renderTodo).join('');
+    }
+    
+    // HTML for one todo; keep in step with templates/_task_items.html
+    function renderTodo(todo) {
+        // Build checklist HTML if it exists
+        let checklistHtml = '';
+        if (todo.checklist && todo.checklist.length > 0) {
+            checklistHtml = `
+                <div class="checklist">
+                    <h4>Subtasks:</h4>
+                    <ul class="checklist-items">
+                        ${todo.checklist.map(item => `
+                            <li class="checklist-item ${item.completed ? 'completed' : ''}">
+                                <span class="checklist-checkbox">${item.completed ? '✅' : '☐'}</span>
+                                <span class="checklist-text">${escapeHtml(item.text)}</span>
+                            </li>
+                        `).join('')}
+                    </ul>
+                    <div class="checklist-progress">
+                        ${todo.checklist.filter(item => item.completed).length} of ${todo.checklist.length} completed
                     </div>
-                    ${checklistHtml}
                 </div>
             `;
-        }).join('');
+        }
+        
+        return `
+            <div class="task-item ${todo.completed ? 'completed' : ''}" data-task-id="${todo.id}">
+                <div class="task-header">
+                    <p class="task-text">${escapeHtml(todo.text)}</p>
+                    <div class="task-actions">
+                        <span class="task-badge badge-todo">Todo</span>
+                        ${todo.completed ? '<span class="task-badge badge-completed">Completed</span>' : ''}
+                        <button class="clone-btn" data-todo-id="${todo.id}" title="Clone this todo">
+                            Clone
+                        </button>
+                    </div>
+                </div>
+                <div class="task-meta">
+                    ${todo.priority ? `<span>Priority: <div class="priority-indicator priority-${getPriorityLevel(todo.priority)}"></div></span>` : ''}
+                    ${todo.date ? `<span>📅 <time datetime="${todo.date}">${formatDate(todo.date)}</time></span>` : ''}
+                    ${todo.notes ? `<span>📝 Has notes</span>` : ''}
+                    ${todo.checklist && todo.checklist.length > 0 ? `<span>📋 ${todo.checklist.length} subtasks</span>` : ''}
+                </div>
+                ${checklistHtml}
+            </div>
+        `;
     }
     
     // Display habits
@@ -291,8 +328,13 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        habitsList.innerHTML = habits.map(habit => `
-            <div class="task-item">
+        habitsList.innerHTML = habits.map(renderHabit).join('');
+    }
+    
+    // HTML for one habit
+    function renderHabit(habit) {
+        return `
+            <div class="task-item" data-task-id="${habit.id}">
                 <div class="task-header">
                     <p class="task-text">${escapeHtml(habit.text)}</p>
                     <span class="task-badge badge-habit">Habit</span>
@@ -302,7 +344,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     ${habit.down ? `<span class="counter negative">↓ ${habit.counterDown || 0}</span>` : ''}
                 </div>
             </div>
-        `).join('');
+        `;
     }
     
     // Display dailies
@@ -314,8 +356,13 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        dailiesList.innerHTML = dailies.map(daily => `
-            <div class="task-item ${daily.completed ? 'completed' : ''}">
+        dailiesList.innerHTML = dailies.map(renderDaily).join('');
+    }
+    
+    // HTML for one daily
+    function renderDaily(daily) {
+        return `
+            <div class="task-item ${daily.completed ? 'completed' : ''}" data-task-id="${daily.id}">
                 <div class="task-header">
                     <p class="task-text">${escapeHtml(daily.text)}</p>
                     <div>
@@ -327,7 +374,128 @@ document.addEventListener('DOMContentLoaded', function() {
                     ${daily.streak ? `<span>🔥 Streak: ${daily.streak}</span>` : ''}
                 </div>
             </div>
-        `).join('');
+        `;
+    }
+    
+    // List element and item renderer for each task type shown on the page
+    const TASK_LISTS = {
+        todo: { listId: 'todosList', render: renderTodo },
+        habit: { listId: 'habitsList', render: renderHabit },
+        daily: { listId: 'dailiesList', render: renderDaily }
+    };
+    
+    // Apply one task change to the page, touching only that task's element
+    function applyTaskChange(event, taskId, task) {
+        // Search results may show the task too; they are left as they are until the next search
+        const existing = document.querySelector(`.task-sections-grid .task-item[data-task-id="${CSS.escape(taskId)}"]`);
+        if (event === 'deleted' || !task || !TASK_LISTS[task.type]) {
+            if (existing) {
+                existing.remove();
+            }
+            return;
+        }
+        
+        const html = TASK_LISTS[task.type].render(task);
+        if (existing) {
+            existing.outerHTML = html;
+            return;
+        }
+        
+        // New tasks go to the top, where Habitica puts them
+        const list = document.getElementById(TASK_LISTS[task.type].listId);
+        if (list) {
+            list.querySelector('.empty-state')?.remove();
+            list.insertAdjacentHTML('afterbegin', html);
+        }
+    }
+    
+    // Show the tasks matching the search box, best matches first
+    const searchInput = document.getElementById('searchInput');
+    const searchResults = document.getElementById('searchResults');
+    let searchSeq = 0;
+    async function searchTasks() {
+        const query = searchInput.value.trim();
+        // Answers to earlier keystrokes that arrive late are dropped
+        const seq = ++searchSeq;
+        if (query.length < 2) {
+            searchResults.innerHTML = '';
+            return;
+        }
+        
+        try {
+            const response = await apiFetch(`/api/search?q=${encodeURIComponent(query)}&type=todo,habit,daily`);
+            const results = await response.json();
+            if (seq !== searchSeq) {
+                return;
+            }
+            if (results.status !== 'success') {
+                throw new Error(results.message || 'Search failed');
+            }
+            searchResults.innerHTML = results.data.length
+                ? results.data.map(task => TASK_LISTS[task.type].render(task)).join('')
+                : '<div class="empty-state"><p>No matching tasks</p></div>';
+        } catch (error) {
+            console.error('Search failed:', error);
+            if (seq === searchSeq) {
+                searchResults.innerHTML = `<div class="empty-state"><p>${escapeHtml(error.message)}</p></div>`;
+            }
+        }
+    }
+    if (searchInput) {
+        searchInput.addEventListener('input', utils.debounce(searchTasks, 200));
+    }
+    
+    // Follow task changes pushed by the server once the lists are shown
+    let liveUpdates = null;
+    function startLiveUpdates() {
+        if (liveUpdates || pollTimer) {
+            return;
+        }
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+        // EventSource can't send headers, so the account goes in the query string. Starting
+        // from the loaded version means changes made since the lists were fetched aren't missed
+        const params = new URLSearchParams();
+        if (ACCOUNT_ID) {
+            params.set('account', ACCOUNT_ID);
+        }
+        if (tasksVersion !== null) {
+            params.set('since', tasksVersion);
+        }
+        liveUpdates = new EventSource(`/api/events?${params}`);
+        ['created', 'updated', 'deleted'].forEach(type => {
+            liveUpdates.addEventListener(type, message => {
+                const change = JSON.parse(message.data);
+                applyTaskChange(change.event, change.task_id, change.task);
+                tasksVersion = Math.max(tasksVersion ?? 0, Number(message.lastEventId));
+            });
+        });
+        // Changes missed while disconnected have been pruned; the changes endpoint then returns every task
+        liveUpdates.addEventListener('reset', () => refreshTasks());
+        // The browser reconnects by itself after network errors, but gives up when the
+        // server refuses the stream (it has no stream slot free), so poll from then on
+        liveUpdates.addEventListener('error', () => {
+            if (liveUpdates.readyState === EventSource.CLOSED) {
+                liveUpdates = null;
+                startPolling();
+            }
+        });
+    }
+    
+    // Fetch the task changes every TASK_POLL_INTERVAL ms while the page is visible
+    const TASK_POLL_INTERVAL = 30000;
+    let pollTimer = null;
+    function startPolling() {
+        if (pollTimer) {
+            return;
+        }
+        pollTimer = setInterval(() => {
+            if (!document.hidden) {
+                refreshTasks();
+            }
+        }, TASK_POLL_INTERVAL);
     }
 
     // Clone todo function
@@ -351,7 +519,7 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             // Make API call to clone the todo
-            const response = await fetch('/api/clone_todo', {
+            const response = await apiFetch('/api/clone_todo', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -365,8 +533,12 @@ document.addEventListener('DOMContentLoaded', function() {
                 console.log('Todo cloned successfully:', result);
                 utils.showNotification('Todo cloned successfully!', 'success');
                 
-                // Reload just the todos to show the new cloned item immediately
-                await refreshTodos();
+                // Show the new todo right away; the live update for it replaces it in place
+                applyTaskChange('created', result.cloned_todo.id, result.cloned_todo);
+                if (!liveUpdates) {
+                    // Without a live update stream, catch up on anything else that changed
+                    await refreshTasks();
+                }
             } else {
                 console.error('Failed to clone todo:', result);
                 utils.showNotification(`Failed to clone todo: ${result.error || 'Unknown error'}`, 'error');
@@ -386,6 +558,25 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Make cloneTodo available globally
     window.cloneTodo = cloneTodo;
+    
+    // Clone buttons, whether rendered by the server or by this script
+    document.addEventListener('click', function(event) {
+        const button = event.target.closest('.clone-btn[data-todo-id]');
+        if (button) {
+            cloneTodo(button.dataset.todoId, button);
+        }
+    });
+    
+    // Task lists rendered by the server only need to be kept current
+    const renderedTasks = document.querySelector('.task-sections-grid[data-version]');
+    if (renderedTasks) {
+        tasksVersion = Number(renderedTasks.dataset.version);
+        // The server formats due dates in UTC; show them in the browser's time zone
+        renderedTasks.querySelectorAll('time[datetime]').forEach(time => {
+            time.textContent = formatDate(time.getAttribute('datetime'));
+        });
+        startLiveUpdates();
+    }
 
 // Utility functions
     function escapeHtml(text) {
@@ -0,0 +1,82 @@
+"""
+Incremental sync of Habitica tasks into the local SQLite store.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict
+
+from . import task_store
+
+logger = logging.getLogger(__name__)
+
+class SyncEngine:
+    """Pulls tasks from Habitica and applies only what changed to the local store"""
+
+    def __init__(self, service):
+        self.service = service
+        # Tasks are stored under the account the service signs in as
+        self.account_id = service.account_id
+        self._lock = threading.Lock()
+
+    def sync(self) -> Dict:
+        """Fetch all tasks and apply the inserts, updates and deletes to the store"""
+        with self._lock:
+            return self._sync()
+
+    def _sync(self) -> Dict:
+        start = time.perf_counter()
+        logger.info(f"Starting task sync for account '{self.account_id}'")
+
+        try:
+            # The cache may predate a task created through another worker, which would then be
+            # deleted here, so the list is always revalidated with Habitica
+            remote_tasks = self.service.get_raw_tasks(fresh=True)
+            stored = task_store.get_task_index(self.account_id)
+
+            inserts, updates, moves = [], [], []
+            for position, task in enumerate(remote_tasks):
+                task_id = task.get('id')
+                if not task_id:
+                    continue
+
+                if task_id not in stored:
+                    inserts.append((task, position))
+                else:
+                    updated_at, stored_position = stored[task_id]
+                    remote_updated_at = task.get('updatedAt')
+                    # A webhook may already have stored a newer version than this list has
+                    newer_locally = updated_at and remote_updated_at and updated_at > remote_updated_at
+                    if updated_at != remote_updated_at and not newer_locally:
+                        updates.append((task, position))
+                    elif stored_position != position:
+                        moves.append((task_id, position))
+
+            remote_ids = {task.get('id') for task in remote_tasks}
+            deletes = [task_id for task_id in stored if task_id not in remote_ids]
+
+            # Tag names are stored first, so the search index of new tasks includes them
+            task_store.save_tags(self.service.get_tags(fresh=True), self.account_id)
+            task_store.apply_changes(inserts, updates, moves, deletes, self.account_id)
+        except Exception as e:
+            duration_ms = (time.perf_counter() - start) * 1000
+            logger.error(f"Task sync failed: {e}")
+            task_store.log_sync('tasks', 'error', str(e), duration_ms=duration_ms, account_id=self.account_id)
+            raise
+
+        duration_ms = (time.perf_counter() - start) * 1000
+        result = {
+            'inserted': len(inserts),
+            'updated': len(updates),
+            'moved': len(moves),
+            'deleted': len(deletes),
+            'total': len(remote_tasks),
+            'duration_ms': round(duration_ms, 1)
+        }
+        message = f"{result['inserted']} inserted, {result['updated']} updated, {result['deleted']} deleted"
+        task_store.log_sync('tasks', 'success', message, record_count=len(remote_tasks), duration_ms=duration_ms,
+                            account_id=self.account_id)
+
+        logger.info(f"Task sync complete in {duration_ms:.0f}ms: {message}")
+        return result
@@ -0,0 +1,656 @@
+"""
+Local copy of each account's Habitica tasks, stored in the SQLite database.
+
+The `tasks` table holds every task with its full JSON in the `data` column;
+the `habits`, `dailies` and `todos` tables hold the type-specific columns.
+Rows are keyed by account, and every function works on one account's tasks
+(the default account unless account_id is given). Every stored change is also
+appended to `task_events`, which the live update stream reads, and its
+sequence number is stamped on the task row as its version. Clients holding
+version N can fetch just the tasks changed since, with the `deleted` events
+serving as tombstones for removed tasks.
+"""
+
+import base64
+import logging
+import os
+import re
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .database import DEFAULT_ACCOUNT, get_connection, transaction
+from .jsonutil import dumps, loads
+from .metrics import time_query, timed_query
+from .profiling import phase
+
+logger = logging.getLogger(__name__)
+
+# Habitica task type -> type-specific table
+TASK_TYPE_TABLES = {
+    'todo': 'todos',
+    'habit': 'habits',
+    'daily': 'dailies'
+}
+
+# Habitica task type -> key in the grouped task response
+TASK_TYPE_KEYS = {
+    'todo': 'todos',
+    'habit': 'habits',
+    'daily': 'dailys'  # Note: Habitica API uses 'dailys' not 'dailies'
+}
+
+# Fields of the compact representation used by list views, by task type.
+# Everything else (history, reminders, challenge and group data, ...) is only
+# returned by the task detail endpoint or when requested with fields=.
+LIST_FIELDS = {
+    'todo': ('id', 'type', 'text', 'notes', 'priority', 'date', 'completed', 'checklist', 'tags'),
+    'habit': ('id', 'type', 'text', 'notes', 'priority', 'up', 'down', 'counterUp', 'counterDown', 'tags'),
+    'daily': ('id', 'type', 'text', 'notes', 'priority', 'completed', 'isDue', 'streak', 'checklist', 'tags'),
+    'reward': ('id', 'type', 'text', 'notes', 'value', 'tags')
+}
+
+CHECKLIST_FIELDS = ('id', 'text', 'completed')
+
+# Seconds that task change events are kept for the live update stream
+EVENT_RETENTION = float(os.getenv('TASK_EVENT_RETENTION', '86400'))
+
+# Most results a search returns
+SEARCH_LIMIT = 50
+
+def summarize_task(task: Dict) -> Dict:
+    """Build the compact list representation of a task"""
+    fields = LIST_FIELDS.get(task.get('type'), LIST_FIELDS['reward'])
+    summary = {field: task[field] for field in fields if field in task}
+    if summary.get('checklist'):
+        summary['checklist'] = [
+            {field: item[field] for field in CHECKLIST_FIELDS if field in item}
+            for item in summary['checklist']
+        ]
+    return summary
+
+def project_task(task: Dict, fields: Optional[List[str]]) -> Dict:
+    """Select top-level fields of a task; None means the compact list representation"""
+    if fields is None:
+        return summarize_task(task)
+    return {field: task[field] for field in fields if field in task}
+
+def _task_row(task: Dict, position: int, account_id: str, version: int) -> Tuple:
+    """Build a row for the tasks table"""
+    return (
+        task['id'],
+        task.get('text', ''),
+        task.get('type', ''),
+        task.get('notes'),
+        task.get('priority'),
+        task.get('value'),
+        task.get('createdAt'),
+        task.get('updatedAt'),
+        bool(task.get('completed', False)),
+        task.get('streak', 0),
+        dumps(task),
+        position,
+        task.get('date') or None,
+        dumps(summarize_task(task)),
+        account_id,
+        version
+    )
+
+def _type_row(task: Dict, account_id: str) -> Optional[Tuple]:
+    """Build a row for the type-specific table of a task"""
+    task_type = task.get('type')
+    common = (
+        task['id'],
+        task.get('text', ''),
+        task.get('notes'),
+        task.get('priority'),
+        task.get('value'),
+        task.get('createdAt'),
+        task.get('updatedAt')
+    )
+
+    if task_type == 'habit':
+        return common + (
+            bool(task.get('up', True)),
+            bool(task.get('down', True)),
+            task.get('counterUp', 0),
+            task.get('counterDown', 0),
+            dumps(task),
+            account_id
+        )
+    if task_type == 'daily':
+        return common + (
+            bool(task.get('completed', False)),
+            task.get('streak', 0),
+            dumps(task),
+            account_id
+        )
+    if task_type == 'todo':
+        return common + (
+            bool(task.get('completed', False)),
+            task.get('date'),
+            dumps(task.get('checklist', [])),
+            dumps(task),
+            account_id
+        )
+    return None
+
+TASK_COLUMNS = ('id, text, type, notes, priority, value, created_at, updated_at, completed, streak, data, '
+                'position, due_date, summary, account_id, version')
+
+TYPE_TABLE_COLUMNS = {
+    'habits': ('id, text, notes, priority, value, created_at, updated_at, up, down, counter_up, counter_down, data, '
+               'account_id'),
+    'dailies': 'id, text, notes, priority, value, created_at, updated_at, completed, streak, data, account_id',
+    'todos': ('id, text, notes, priority, value, created_at, updated_at, completed, due_date, checklist, data, '
+              'account_id')
+}
+
+@timed_query
+def get_task_index(account_id: str = DEFAULT_ACCOUNT) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+    """Get the stored updatedAt and position of every task, keyed by task ID"""
+    conn = get_connection()
+    rows = conn.execute('SELECT id, updated_at, position FROM tasks WHERE account_id = ?', (account_id,)).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+@timed_query
+def apply_changes(inserts: List[Tuple[Dict, int]], updates: List[Tuple[Dict, int]],
+                  moves: List[Tuple[str, int]], deletes: List[str], account_id: str = DEFAULT_ACCOUNT):
+    """Apply a task diff in a single transaction.
+
+    inserts and updates are (task, position) pairs, moves are (task_id, position)
+    pairs for tasks that were only reordered, and deletes are task IDs.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        # Change events are numbered inserts first, then updates, then deletes (and
+        # a reorder); the numbers double as the versions of the inserted and updated rows
+        first_seq = _last_event_seq(conn) + 1
+        versions = range(first_seq, first_seq + len(inserts) + len(updates) + len(deletes) + bool(moves))
+        insert_versions = versions[:len(inserts)]
+        update_versions = versions[len(inserts):len(inserts) + len(updates)]
+
+        if deletes:
+            delete_rows = [(task_id,) for task_id in deletes]
+            cursor.executemany('DELETE FROM tasks WHERE id = ? AND account_id = ?',
+                               [(task_id, account_id) for task_id in deletes])
+            cursor.executemany('DELETE FROM task_tags WHERE task_id = ?', delete_rows)
+            for table in TASK_TYPE_TABLES.values():
+                cursor.executemany(f'DELETE FROM {table} WHERE id = ?', delete_rows)
+
+        if inserts:
+            placeholders = ', '.join('?' * 16)
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO tasks ({TASK_COLUMNS}) VALUES ({placeholders})',
+                [_task_row(task, position, account_id, version)
+                 for (task, position), version in zip(inserts, insert_versions)]
+            )
+
+        if updates:
+            cursor.executemany(
+                '''UPDATE tasks SET text = ?, type = ?, notes = ?, priority = ?, value = ?,
+                   created_at = ?, updated_at = ?, completed = ?, streak = ?, data = ?, position = ?,
+                   due_date = ?, summary = ?, version = ? WHERE id = ? AND account_id = ?''',
+                [_task_row(task, position, account_id, version)[1:-2] + (version, task['id'], account_id)
+                 for (task, position), version in zip(updates, update_versions)]
+            )
+
+        if moves:
+            cursor.executemany('UPDATE tasks SET position = ? WHERE id = ? AND account_id = ?',
+                               [(position, task_id, account_id) for task_id, position in moves])
+
+        # Tags are replaced for every inserted or updated task
+        if inserts or updates:
+            changed = inserts + updates
+            cursor.executemany('DELETE FROM task_tags WHERE task_id = ?',
+                               [(task['id'],) for task, _ in changed])
+            cursor.executemany(
+                'INSERT OR IGNORE INTO task_tags (task_id, tag_id) VALUES (?, ?)',
+                [(task['id'], tag_id) for task, _ in changed for tag_id in task.get('tags') or []]
+            )
+
+        # Type-specific tables are rewritten for every inserted or updated task
+        type_rows: Dict[str, List[Tuple]] = {}
+        for task, _ in inserts + updates:
+            row = _type_row(task, account_id)
+            if row is not None:
+                type_rows.setdefault(TASK_TYPE_TABLES[task['type']], []).append(row)
+
+        for table, rows in type_rows.items():
+            columns = TYPE_TABLE_COLUMNS[table]
+            placeholders = ', '.join('?' * len(rows[0]))
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})', rows
+            )
+
+        # Reorders get one event without a task, as a new task at the top moves every
+        # other task; it advances the version, so lists cached by version are redrawn
+        now = time.time()
+        events = [(task['id'], 'created') for task, _ in inserts]
+        events += [(task['id'], 'updated') for task, _ in updates]
+        events += [(task_id, 'deleted') for task_id in deletes]
+        if moves:
+            events.append(('', 'reordered'))
+        if events:
+            cursor.executemany(
+                'INSERT INTO task_events (seq, account_id, task_id, event, created_at) VALUES (?, ?, ?, ?, ?)',
+                [(seq, account_id, task_id, event, now) for seq, (task_id, event) in zip(versions, events)]
+            )
+            cursor.execute('DELETE FROM task_events WHERE created_at < ?', (now - EVENT_RETENTION,))
+
+def _last_event_seq(conn) -> int:
+    """Highest task_events sequence number ever used, including pruned events"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'task_events'").fetchone()
+    return row[0] if row else 0
+
+def _event_horizon(conn) -> int:
+    """Highest sequence number whose event may have been pruned"""
+    row = conn.execute('SELECT MIN(seq) FROM task_events').fetchone()
+    return row[0] - 1 if row[0] is not None else _last_event_seq(conn)
+
+@timed_query
+def add_tasks(tasks: List[Dict], account_id: str = DEFAULT_ACCOUNT):
+    """Store tasks created by this application, ahead of the existing tasks"""
+    if not tasks:
+        return
+
+    conn = get_connection()
+    row = conn.execute('SELECT MIN(position) FROM tasks WHERE account_id = ?', (account_id,)).fetchone()
+
+    # Habitica puts each new task at the top of its list, so the last one created comes first
+    top = (row[0] or 0) - 1
+    apply_changes([(task, top - i) for i, task in enumerate(tasks)], [], [], [], account_id)
+
+def add_task(task: Dict, account_id: str = DEFAULT_ACCOUNT):
+    """Store a task created by this application"""
+    add_tasks([task], account_id)
+
+@timed_query
+def save_task(task: Dict, account_id: str = DEFAULT_ACCOUNT) -> bool:
+    """Store one changed task, keeping its position if it is already stored.
+
+    Returns False without writing if the stored copy is newer (by updatedAt),
+    e.g. when updates arrive out of order.
+    """
+    with transaction() as conn:
+        row = conn.execute('SELECT position, updated_at FROM tasks WHERE id = ? AND account_id = ?',
+                           (task['id'], account_id)).fetchone()
+        if row is None:
+            add_tasks([task], account_id)
+            return True
+
+        position, updated_at = row
+        if updated_at and task.get('updatedAt') and updated_at > task['updatedAt']:
+            return False
+        apply_changes([], [(task, position)], [], [], account_id)
+        return True
+
+@timed_query
+def delete_task(task_id: str, account_id: str = DEFAULT_ACCOUNT) -> bool:
+    """Remove one task; returns False if it wasn't stored"""
+    with transaction() as conn:
+        exists = conn.execute('SELECT 1 FROM tasks WHERE id = ? AND account_id = ?',
+                              (task_id, account_id)).fetchone() is not None
+        if exists:
+            apply_changes([], [], [], [task_id], account_id)
+        return exists
+
+@timed_query
+def save_tags(tags: List[Dict], account_id: str = DEFAULT_ACCOUNT):
+    """Store the names of an account's tags, replacing the stored ones.
+
+    Only tags that are new, renamed or gone are written, as each of those
+    rewrites the search index entries of the tasks carrying the tag.
+    """
+    with transaction() as conn:
+        conn.executemany(
+            '''INSERT INTO tags (account_id, id, name) VALUES (?, ?, ?)
+               ON CONFLICT (account_id, id) DO UPDATE SET name = excluded.name WHERE name != excluded.name''',
+            [(account_id, tag['id'], tag.get('name') or '') for tag in tags if tag.get('id')]
+        )
+        stored = {row[0] for row in conn.execute('SELECT id FROM tags WHERE account_id = ?', (account_id,))}
+        removed = stored - {tag.get('id') for tag in tags}
+        conn.executemany('DELETE FROM tags WHERE account_id = ? AND id = ?',
+                         [(account_id, tag_id) for tag_id in removed])
+
+@timed_query
+def has_tasks(account_id: str = DEFAULT_ACCOUNT) -> bool:
+    """Check whether any tasks have been stored"""
+    conn = get_connection()
+    return conn.execute('SELECT 1 FROM tasks WHERE account_id = ? LIMIT 1', (account_id,)).fetchone() is not None
+
+def _load_task(summary: Optional[str], data: str, fields: Optional[List[str]]) -> Dict:
+    """Decode a stored task in the requested representation.
+
+    fields=None gives the compact representation, read from the precomputed
+    summary column when present; ['all'] gives the full task.
+    """
+    if fields is None and summary is not None:
+        return loads(summary)
+    task = loads(data)
+    if fields == ['all']:
+        return task
+    return project_task(task, fields)
+
+def _task_json(summary: Optional[str], data: str, fields: Optional[List[str]]) -> str:
+    """Encoded form of _load_task; the stored JSON is passed through when it can be"""
+    if fields is None and summary is not None:
+        return summary
+    if fields == ['all']:
+        return data
+    return dumps(_load_task(summary, data, fields))
+
+@timed_query
+def get_task(task_id: str, account_id: str = DEFAULT_ACCOUNT) -> Optional[Dict]:
+    """Get the full stored representation of one task"""
+    conn = get_connection()
+    row = conn.execute('SELECT data FROM tasks WHERE id = ? AND account_id = ?', (task_id, account_id)).fetchone()
+    return loads(row[0]) if row else None
+
+# Sort keys accepted by query_tasks -> SQL expression
+SORT_EXPRESSIONS = {
+    'position': 'position',
+    'text': 'text',
+    'priority': 'priority',
+    'due_date': "COALESCE(due_date, '9999')",  # Missing due dates sort last
+    'created': "COALESCE(created_at, '')",
+    'updated': "COALESCE(updated_at, '')"
+}
+
+def _encode_cursor(sort_value, task_id: str) -> str:
+    """Encode the position after the last row of a page"""
+    raw = dumps([sort_value, task_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_cursor(cursor: str) -> Tuple:
+    """Decode a cursor produced by _encode_cursor"""
+    try:
+        sort_value, task_id = loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return sort_value, task_id
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def _task_query(types: Optional[List[str]] = None, completed: Optional[bool] = None,
+                tag: Optional[str] = None, due_from: Optional[str] = None, due_to: Optional[str] = None,
+                search: Optional[str] = None, sort: str = 'position', descending: bool = False,
+                limit: Optional[int] = None, cursor: Optional[str] = None,
+                fields: Optional[List[str]] = None,
+                account_id: str = DEFAULT_ACCOUNT) -> Tuple[str, List]:
+    """Build the SQL selecting (sort value, id, summary, data) for query_tasks; raises ValueError"""
+    if sort not in SORT_EXPRESSIONS:
+        raise ValueError(f"Invalid sort key '{sort}'. Expected one of: {', '.join(SORT_EXPRESSIONS)}")
+    sort_expression = SORT_EXPRESSIONS[sort]
+    if sort == 'due_date' and descending:
+        # Tasks without a due date go last in either direction
+        sort_expression = "COALESCE(due_date, '')"
+
+    conditions, params = ['account_id = ?'], [account_id]
+    if types:
+        conditions.append(f"type IN ({', '.join('?' * len(types))})")
+        params.extend(types)
+    if completed is not None:
+        conditions.append('completed = ?')
+        params.append(completed)
+    if tag:
+        conditions.append('id IN (SELECT task_id FROM task_tags WHERE tag_id = ?)')
+        params.append(tag)
+    if due_from:
+        conditions.append('due_date >= ?')
+        params.append(due_from)
+    if due_to:
+        conditions.append('due_date < ?')
+        params.append(due_to)
+    if search:
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append("(text LIKE ? ESCAPE '\\' OR notes LIKE ? ESCAPE '\\')")
+        params.extend([pattern, pattern])
+    if cursor:
+        sort_value, last_id = _decode_cursor(cursor)
+        op = '<' if descending else '>'
+        conditions.append(f'({sort_expression} {op} ? OR ({sort_expression} = ? AND id {op} ?))')
+        params.extend([sort_value, sort_value, last_id])
+
+    direction = 'DESC' if descending else 'ASC'
+    # The full JSON is only read when the compact representation can't come from the summary
+    data_column = 'CASE WHEN summary IS NULL THEN data END' if fields is None else 'data'
+    sql = f'SELECT {sort_expression}, id, summary, {data_column} FROM tasks WHERE ' + ' AND '.join(conditions)
+    sql += f' ORDER BY {sort_expression} {direction}, id {direction}'
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    return sql, params
+
+@timed_query
+def query_tasks(types: Optional[List[str]] = None, completed: Optional[bool] = None,
+                tag: Optional[str] = None, due_from: Optional[str] = None, due_to: Optional[str] = None,
+                search: Optional[str] = None, sort: str = 'position', descending: bool = False,
+                limit: Optional[int] = None, cursor: Optional[str] = None,
+                fields: Optional[List[str]] = None,
+                account_id: str = DEFAULT_ACCOUNT) -> Tuple[List[Dict], Optional[str]]:
+    """Filter, sort and page the stored tasks.
+
+    due_from is inclusive and due_to exclusive (ISO dates or timestamps).
+    fields selects the representation, as in _load_task.
+    Returns the page and the cursor for the next page (None on the last page).
+    """
+    sql, params = _task_query(types, completed, tag, due_from, due_to, search, sort, descending, limit, cursor,
+                              fields, account_id)
+    rows = get_connection().execute(sql, params).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][0], rows[-1][1])
+
+    return [_load_task(row[2], row[3], fields) for row in rows], next_cursor
+
+class TaskStream:
+    """The tasks matching a query_tasks query, read and encoded a batch of rows at a time.
+
+    Iterating yields each task as a JSON string, so a response can be written
+    while the rows are read and memory use doesn't grow with the number of
+    tasks. The arguments are those of query_tasks and are checked right away;
+    next_cursor is set once the stream has been consumed.
+    """
+
+    # Rows fetched from SQLite at a time
+    BATCH_SIZE = 500
+
+    def __init__(self, fields: Optional[List[str]] = None, limit: Optional[int] = None, **query):
+        self.fields = fields
+        self.limit = limit
+        self.sql, self.params = _task_query(limit=limit, fields=fields, **query)
+        self.next_cursor: Optional[str] = None
+
+    def __iter__(self) -> Iterator[str]:
+        with time_query('stream_tasks'):
+            rows = get_connection().execute(self.sql, self.params)
+        count, last = 0, None
+        try:
+            while True:
+                # Timed per batch, as the response is written in between
+                with time_query('stream_tasks'):
+                    batch = rows.fetchmany(self.BATCH_SIZE)
+                if not batch:
+                    return
+                # Encoded a batch at a time, which keeps the phase bookkeeping out of the per-task loop
+                with phase('json'):
+                    encoded = [_task_json(row[2], row[3], self.fields) for row in batch]
+                for row, task in zip(batch, encoded):
+                    if count == self.limit:
+                        # The extra row: there is a next page after the last one yielded
+                        self.next_cursor = _encode_cursor(last[0], last[1])
+                        return
+                    yield task
+                    count, last = count + 1, row
+        finally:
+            rows.close()
+
+def _match_expression(query: str) -> str:
+    """FTS5 query matching tasks that contain every word of query, whole or as the start of a word.
+
+    Words are quoted, so FTS5 operators and punctuation in the query are
+    treated as plain text. Raises ValueError if the query has no words.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        raise ValueError('Search query must contain a letter or digit')
+    return ' '.join(f'"{word}"*' for word in words)
+
+@timed_query
+def search_tasks(query: str, types: Optional[List[str]] = None, limit: int = SEARCH_LIMIT,
+                 fields: Optional[List[str]] = None, account_id: str = DEFAULT_ACCOUNT) -> List[Dict]:
+    """Tasks whose text, notes, checklist items or tag names contain the words of query.
+
+    Every word also matches longer words it starts with, so 'gro' finds
+    'groceries'. The best matches come first, ranked by the tasks_fts bm25
+    weights, which favour the task text; fields selects the representation, as
+    in _load_task. Raises ValueError for a query without words.
+    """
+    conditions = ['tasks_fts MATCH ?', 'tasks.account_id = ?']
+    params = [_match_expression(query), account_id]
+    if types:
+        conditions.append(f"tasks.type IN ({', '.join('?' * len(types))})")
+        params.extend(types)
+    params.append(limit)
+
+    data_column = 'CASE WHEN tasks.summary IS NULL THEN tasks.data END' if fields is None else 'tasks.data'
+    rows = get_connection().execute(
+        f'''SELECT tasks.summary, {data_column} FROM tasks_fts JOIN tasks ON tasks.rowid = tasks_fts.rowid
+            WHERE {' AND '.join(conditions)} ORDER BY tasks_fts.rank, tasks.position LIMIT ?''',
+        params
+    ).fetchall()
+    return [_load_task(summary, data, fields) for summary, data in rows]
+
+@timed_query
+def get_last_event_id(account_id: str = DEFAULT_ACCOUNT) -> int:
+    """Sequence number of the account's latest task change event (0 if there is none)"""
+    row = get_connection().execute('SELECT MAX(seq) FROM task_events WHERE account_id = ?', (account_id,)).fetchone()
+    return row[0] or 0
+
+@timed_query
+def get_task_events(since: int, limit: int = 500,
+                    account_id: str = DEFAULT_ACCOUNT) -> Tuple[List[Dict], int]:
+    """Get the task changes after sequence number since, oldest first.
+
+    Created and updated events carry the task's current compact representation;
+    those of tasks deleted since are left out, as a later deleted event follows.
+    Reordered events are left out too, as list items aren't moved live.
+    Returns the events and the sequence number to continue from.
+    """
+    rows = get_connection().execute(
+        '''SELECT e.seq, e.event, e.task_id, t.summary FROM task_events e
+           LEFT JOIN tasks t ON t.id = e.task_id AND t.account_id = e.account_id
+           WHERE e.account_id = ? AND e.seq > ? ORDER BY e.seq LIMIT ?''',
+        (account_id, since, limit)
+    ).fetchall()
+
+    events = []
+    for seq, event, task_id, summary in rows:
+        if event == 'reordered' or (event != 'deleted' and summary is None):
+            continue
+        events.append({
+            'id': seq,
+            'event': event,
+            'task_id': task_id,
+            'task': loads(summary) if event != 'deleted' else None
+        })
+    return events, rows[-1][0] if rows else since
+
+@timed_query
+def get_version() -> int:
+    """Current change version: the sequence number of the latest task change of any account"""
+    return _last_event_seq(get_connection())
+
+@timed_query
+def get_event_horizon() -> int:
+    """Sequence number a client must have seen for its missed changes to still be in task_events"""
+    return _event_horizon(get_connection())
+
+@timed_query
+def get_changes(since: int, types: Optional[List[str]] = None, fields: Optional[List[str]] = None,
+                account_id: str = DEFAULT_ACCOUNT) -> Dict:
+    """Get the tasks inserted or modified and the task IDs deleted after version since.
+
+    When since is 0 or older than the pruned events, every task is returned
+    with reset=True, and the client should replace what it has. The returned
+    version is the one to ask for changes since next time.
+    """
+    with transaction(immediate=False) as conn:
+        version = _last_event_seq(conn)
+
+        if since <= 0 or since < _event_horizon(conn):
+            tasks, _ = query_tasks(types=types, fields=fields, account_id=account_id)
+            return {'changed': tasks, 'deleted': [], 'reset': True, 'version': version}
+
+        sql = 'SELECT summary, data FROM tasks WHERE account_id = ? AND version > ?'
+        params = [account_id, since]
+        if types:
+            sql += f" AND type IN ({', '.join('?' * len(types))})"
+            params.extend(types)
+        rows = conn.execute(sql + ' ORDER BY version', params).fetchall()
+
+        # Deleted events of tasks that don't exist any more are the tombstones
+        deleted = conn.execute(
+            '''SELECT DISTINCT task_id FROM task_events e
+               WHERE e.account_id = ? AND e.seq > ? AND e.event = 'deleted'
+               AND NOT EXISTS (SELECT 1 FROM tasks t WHERE t.id = e.task_id AND t.account_id = e.account_id)''',
+            (account_id, since)
+        ).fetchall()
+
+    return {
+        'changed': [_load_task(summary, data, fields) for summary, data in rows],
+        'deleted': [row[0] for row in deleted],
+        'reset': False,
+        'version': version
+    }
+
+@timed_query
+def log_sync(sync_type: str, status: str, message: str, record_count: Optional[int] = None,
+             duration_ms: Optional[float] = None, account_id: str = DEFAULT_ACCOUNT):
+    """Record the result of a sync in the sync_log table"""
+    get_connection().execute(
+        'INSERT INTO sync_log (sync_type, status, message, record_count, duration_ms, account_id) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (sync_type, status, message, record_count, duration_ms, account_id)
+    )
+
+@timed_query
+def get_last_sync(sync_type: str = 'tasks', status: str = 'success',
+                  account_id: str = DEFAULT_ACCOUNT) -> Optional[Dict]:
+    """Get the most recent sync of a type with the given status, including its age in seconds"""
+    conn = get_connection()
+    row = conn.execute(
+        '''SELECT sync_time, message, record_count, duration_ms,
+                  (julianday('now') - julianday(sync_time)) * 86400
+           FROM sync_log WHERE account_id = ? AND sync_type = ? AND status = ?
+           ORDER BY sync_time DESC, id DESC LIMIT 1''',
+        (account_id, sync_type, status)
+    ).fetchone()
+
+    if row is None:
+        return None
+    return {
+        'sync_time': row[0],
+        'message': row[1],
+        'record_count': row[2],
+        'duration_ms': row[3],
+        'age': row[4]
+    }
+
+@timed_query
+def get_sync_stats() -> List[Tuple[str, int, Optional[float]]]:
+    """Count and total duration (ms) of the logged task syncs of all accounts, by status"""
+    return get_connection().execute(
+        "SELECT status, COUNT(*), SUM(duration_ms) FROM sync_log WHERE sync_type = 'tasks' GROUP BY status"
+    ).fetchall()
+
+@timed_query
+def delete_account_data(account_id: str):
+    """Remove the stored tasks, change events and sync history of an account"""
+    with transaction() as conn:
+        conn.execute('DELETE FROM task_tags WHERE task_id IN (SELECT id FROM tasks WHERE account_id = ?)',
+                     (account_id,))
+        for table in ('tasks', 'tags', 'task_events', 'sync_log') + tuple(TASK_TYPE_TABLES.values()):
+            conn.execute(f'DELETE FROM {table} WHERE account_id = ?', (account_id,))
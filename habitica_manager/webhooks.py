@@ -0,0 +1,86 @@
+"""
+Habitica webhooks: task changes pushed by Habitica instead of polled.
+
+A taskActivity webhook delivers each created, updated, scored or deleted task,
+and the change is applied to that one row of the local store. Habitica doesn't
+sign deliveries, so the registered URL carries a token derived from
+WEBHOOK_SECRET and the account ID, and the payload's user must match the
+account. Webhooks stay off while the secret is unset or a published default.
+"""
+
+import hashlib
+import hmac
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+from prometheus_client import Counter
+
+from . import task_store
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = '/webhooks/habitica'
+
+# Label of the webhook this application registers with Habitica
+WEBHOOK_LABEL = 'Habitica Manager'
+
+# taskActivity event types that change a task
+TASK_EVENTS = ('created', 'updated', 'scored', 'checklistScored', 'deleted')
+
+# The SECRET_KEY create_app() falls back to and the .env.example placeholders; tokens
+# derived from a secret anyone can look up could be forged
+INSECURE_SECRETS = frozenset({'dev-secret-key-change-in-production', 'your-secret-key-here',
+                              'your-webhook-secret-here'})
+
+WEBHOOK_EVENTS = Counter('hbm_webhook_events_total', 'Habitica webhook deliveries, by event and result',
+                         ['event', 'result'])
+
+def secret_configured(secret: Optional[str]) -> bool:
+    """Whether secret may sign webhook tokens: it is set and not a published default"""
+    return bool(secret) and secret not in INSECURE_SECRETS
+
+def webhook_token(secret: str, account_id: str) -> str:
+    """Token that authenticates deliveries for an account"""
+    return hmac.new(secret.encode('utf-8'), account_id.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+def verify_token(secret: str, account_id: str, token: str) -> bool:
+    """Check a delivery's token in constant time"""
+    return hmac.compare_digest(webhook_token(secret, account_id), token)
+
+def webhook_url(base_url: str, secret: str, account_id: str) -> str:
+    """URL to register with Habitica for an account, given this deployment's public base URL"""
+    query = urlencode({'account': account_id, 'token': webhook_token(secret, account_id)})
+    return f"{base_url.rstrip('/')}{WEBHOOK_PATH}?{query}"
+
+def apply_event(payload: Optional[Dict], account_id: str, user_id: str) -> Dict:
+    """Apply a taskActivity delivery to the account's stored tasks.
+
+    Raises ValueError for malformed payloads and PermissionError when the
+    delivery is for another Habitica user.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('Expected a JSON object')
+
+    sender = (payload.get('user') or {}).get('_id')
+    if sender is not None and sender != user_id:
+        raise PermissionError('Delivery is for another Habitica user')
+
+    event = payload.get('type')
+    if payload.get('webhookType', 'taskActivity') != 'taskActivity' or event not in TASK_EVENTS:
+        WEBHOOK_EVENTS.labels('other', 'ignored').inc()
+        return {'event': event, 'applied': False}
+
+    task = payload.get('task')
+    task_id = (task.get('id') or task.get('_id')) if isinstance(task, dict) else None
+    if not task_id:
+        raise ValueError(f"'{event}' event without a task ID")
+
+    if event == 'deleted':
+        applied = task_store.delete_task(task_id, account_id)
+    else:
+        applied = task_store.save_task(dict(task, id=task_id), account_id)
+
+    WEBHOOK_EVENTS.labels(event, 'applied' if applied else 'ignored').inc()
+    logger.debug(f"Webhook {event} for task {task_id} ({'applied' if applied else 'ignored'})")
+    return {'event': event, 'task_id': task_id, 'applied': applied}
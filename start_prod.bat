@@ -8,9 +8,13 @@ echo.
 echo Installing/updating Gunicorn...
 pip install gunicorn
 
+echo.
+echo Building static assets...
+flask --app wsgi assets build
+
 echo.
 echo Starting Gunicorn server...
-gunicorn -c gunicorn.conf.py habitica_manager.app:app
+gunicorn -c gunicorn.conf.py wsgi:app
 
 echo.
 echo Server stopped.
@@ -0,0 +1,7 @@
+"""
+WSGI entry point for production servers, e.g. `gunicorn -c gunicorn.conf.py wsgi:app`.
+"""
+
+from habitica_manager.app import create_app
+
+app = create_app()